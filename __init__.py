@@ -30,7 +30,13 @@ def initialize(rhapi):
 
     rhapi.events.on(Evt.VRX_INITIALIZE, controller.registerHandlers)
     rhapi.events.on(Evt.PILOT_ALTER, controller.onPilotAlter)
+    for event in (Evt.PILOT_DELETE, Evt.DATABASE_RESET, Evt.DATABASE_RESTORE, Evt.DATABASE_RECOVER, Evt.DATABASE_IMPORT):
+        rhapi.events.on(event, controller.onPilotsReplaced)
+    rhapi.events.on(Evt.STARTUP, controller.setOptions)
     rhapi.events.on(Evt.OPTION_SET, controller.setOptions)
+    # A replaced database brings its own options without an OPTION_SET, they are reloaded in full
+    for event in (Evt.DATABASE_RESET, Evt.DATABASE_RESTORE, Evt.DATABASE_RECOVER):
+        rhapi.events.on(event, controller.setOptions)
 
     #
     # Setup UI
@@ -50,12 +56,26 @@ def initialize(rhapi):
 
     rhapi.ui.register_panel('elrs_vrxc', 'OSD Notification Settings', 'settings', order=0)
 
+    rhapi.ui.register_panel('elrs_metrics', 'OSD Delivery Metrics', 'settings', order=0)
+
     #
     # Check Boxes
     #
 
     _race_control = UIField('_race_control', 'Race Control from Transmitter', desc='Allows the race director to remotely control races', field_type = UIFieldType.CHECKBOX)
     rhapi.fields.register_option(_race_control, 'elrs_settings')
+
+    _osd_full_rows = UIField('_osd_full_rows', 'Full Row OSD Updates', desc='Rewrites whole rows instead of only the changed characters', field_type = UIFieldType.CHECKBOX)
+    rhapi.fields.register_option(_osd_full_rows, 'elrs_settings')
+
+    _bp_batch = UIField('_bp_batch', 'Coalesce Backpack Writes', desc='Sends each pilot update to the backpack as a single serial write', field_type = UIFieldType.CHECKBOX)
+    rhapi.fields.register_option(_bp_batch, 'elrs_settings')
+
+    _bp_multi = UIField('_bp_multi', 'Use All Connected Backpacks', desc='Spreads pilots over every backpack found, checked again every 30 seconds', field_type = UIFieldType.CHECKBOX)
+    rhapi.fields.register_option(_bp_multi, 'elrs_settings')
+
+    _bp_adaptive = UIField('_bp_adaptive', 'Adaptive Send Pacing', desc='Adjusts the send delay and repeats to the measured backpack throughput, up to the configured values', field_type = UIFieldType.CHECKBOX)
+    rhapi.fields.register_option(_bp_adaptive, 'elrs_settings')
     
     _heat_name = UIField('_heat_name', 'Show Race Name on Stage', field_type = UIFieldType.CHECKBOX)
     rhapi.fields.register_option(_heat_name, 'elrs_vrxc')
@@ -107,6 +127,9 @@ def initialize(rhapi):
     _announcement_uptime = UIField('_announcement_uptime', 'Announcement Uptime', desc='decaseconds', field_type = UIFieldType.BASIC_INT, value=50)
     rhapi.fields.register_option(_announcement_uptime, 'elrs_vrxc')
 
+    _lap_window = UIField('_lap_window', 'Position Update Window', desc='milliseconds, position changes within the window are sent as one update', field_type = UIFieldType.BASIC_INT, value=100)
+    rhapi.fields.register_option(_lap_window, 'elrs_vrxc')
+
     _status_row = UIField('_status_row', 'Race Status Row', desc='Use rows between 0-9 or 15-17', field_type = UIFieldType.BASIC_INT, value=5)
     rhapi.fields.register_option(_status_row, 'elrs_vrxc')
 
@@ -125,6 +148,19 @@ def initialize(rhapi):
     _bp_delay = UIField('_bp_delay', 'Send delay between messages', desc='tens of microseconds', field_type = UIFieldType.BASIC_INT, value=80)
     rhapi.fields.register_option(_bp_delay, 'elrs_settings')
 
+    _bp_delay_min = UIField('_bp_delay_min', 'Minimum adaptive send delay', desc='tens of microseconds', field_type = UIFieldType.BASIC_INT, value=0)
+    rhapi.fields.register_option(_bp_delay_min, 'elrs_settings')
+
+    transport_types = [
+        UIFieldSelectOption(label='Event-driven', value='selector'),
+        UIFieldSelectOption(label='Polling thread', value='polling'),
+    ]
+    _bp_transport = UIField('_bp_transport', 'Backpack Transport', desc='Takes effect when the backpack reconnects', field_type = UIFieldType.SELECT, options = transport_types, value='selector')
+    rhapi.fields.register_option(_bp_transport, 'elrs_settings')
+
+    _bp_batch_size = UIField('_bp_batch_size', 'Max bytes per coalesced write', desc='Size of one batched serial write', field_type = UIFieldType.BASIC_INT, value=256)
+    rhapi.fields.register_option(_bp_batch_size, 'elrs_settings')
+
     #
     # Quick Buttons
     #
@@ -132,5 +168,7 @@ def initialize(rhapi):
     rhapi.ui.register_quickbutton('elrs_settings', 'enable_bind', "Start Backpack Bind", controller.activate_bind)
     rhapi.ui.register_quickbutton('elrs_settings', 'test_osd', "Test Bound Backpack's OSD", controller.test_osd)
     rhapi.ui.register_quickbutton('elrs_settings', 'enable_wifi', "Start Backpack WiFi", controller.activate_wifi)
+    rhapi.ui.register_quickbutton('elrs_metrics', 'dump_metrics', "Write Metrics File", controller.dump_metrics)
+    rhapi.ui.register_quickbutton('elrs_metrics', 'reset_metrics', "Reset Metrics", controller.reset_metrics)
     if RealRPiGPIOFlag:
         rhapi.ui.register_quickbutton('elrs_settings', 'reboot_esp', "Reboot NuclearHazard ESP32", controller.reboot_esp)
\ No newline at end of file
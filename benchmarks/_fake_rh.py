@@ -0,0 +1,163 @@
+"""
+Minimal stand-ins for the parts of the RotorHazard server the plugin talks
+to: the server modules elrsBackpack imports and an RHAPI object backed by
+in-memory pilots, heats and options.OPTION_DEFAULTS. Real modules are
+used when they are importable.
+"""
+
+import enum
+import sys
+import types
+
+from threading import Thread
+
+import _plugin_path
+
+from plugins.VRxC_ELRS.options import OPTION_DEFAULTS as PLUGIN_DEFAULTS
+
+#
+# Server modules
+#
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+def _time_format(millis, time_format='{m}:{s}.{d}'):
+    millis = int(millis or 0)
+    minutes, millis = divmod(millis, 60000)
+    seconds, millis = divmod(millis, 1000)
+    return time_format.format(m=minutes, s=f'{seconds:02d}', d=f'{millis:03d}')
+
+class RaceStatus(enum.IntEnum):
+    READY = 0
+    RACING = 1
+    DONE = 2
+    STAGING = 3
+
+class VRxController():
+    def __init__(self, name, label):
+        self.name = name
+        self.label = label
+
+def _spawn(fn, *args, **kwargs):
+    thread = Thread(target=fn, args=args, kwargs=kwargs, daemon=True)
+    thread.start()
+    return thread
+
+def install():
+    for name, attributes in (
+        ('RHUtils', {'time_format': _time_format}),
+        ('RHRace', {'RaceStatus': RaceStatus}),
+        ('VRxControl', {'VRxController': VRxController}),
+        ('RHGPIO', {'RealRPiGPIOFlag': False}),
+        ('gevent', {'spawn': _spawn}),
+    ):
+        try:
+            __import__(name)
+        except ImportError:
+            _module(name, **attributes)
+
+#
+# RHAPI
+#
+
+# The plugin's own defaults, with its display options turned on so every message type is exercised
+OPTION_DEFAULTS = dict(PLUGIN_DEFAULTS)
+OPTION_DEFAULTS.update({
+    '_heat_name'            : '1',
+    '_position_mode'        : '1',
+    '_gap_mode'             : '1',
+    '_results_mode'         : '1',
+})
+
+class _record():
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+class fake_db():
+
+    def __init__(self, pilots:dict, heats:dict, options:dict=None):
+        # pilots: id -> {'callsign', 'hardware_type', 'comm_elrs'}; heats: id -> [pilot ids]
+        self._pilots = pilots
+        self._heats = heats
+        self._options = dict(OPTION_DEFAULTS)
+        self._options.update(options or {})
+        self.queries = 0
+
+    def option(self, name):
+        self.queries += 1
+        return self._options.get(name)
+
+    def pilot_attributes(self, pilot_id):
+        self.queries += 1
+        pilot = self._pilots[pilot_id]
+        return [_record(name=name, value=pilot.get(name)) for name in ('hardware_type', 'comm_elrs')]
+
+    def pilot_attribute_value(self, pilot_id, name):
+        self.queries += 1
+        return self._pilots[pilot_id].get(name)
+
+    def pilot_by_id(self, pilot_id):
+        self.queries += 1
+        return _record(id=pilot_id, callsign=self._pilots[pilot_id]['callsign'])
+
+    def slots_by_heat(self, heat_id):
+        self.queries += 1
+        return [_record(pilot_id=pilot_id, heat_id=heat_id) for pilot_id in self._heats[heat_id]]
+
+    def heat_by_id(self, heat_id):
+        self.queries += 1
+        return _record(id=heat_id, name=f'Heat {heat_id}', class_id=1)
+
+    def raceclass_by_id(self, class_id):
+        self.queries += 1
+        return _record(id=class_id, name='Open')
+
+    def heat_max_round(self, heat_id):
+        self.queries += 1
+        return 0
+
+class fake_ui():
+
+    def __init__(self):
+        self.markdown = {}
+        self.messages = []
+
+    def message_notify(self, message):
+        self.messages.append(message)
+
+    def message_alert(self, message):
+        self.messages.append(message)
+
+    def register_markdown(self, panel, name, desc):
+        self.markdown[name] = desc
+
+    def broadcast_ui(self, page):
+        pass
+
+class fake_language():
+    def __(self, text):
+        return text
+
+class fake_race():
+    status = RaceStatus.READY
+
+    def stage(self, args):
+        self.status = RaceStatus.STAGING
+
+    def stop(self):
+        self.status = RaceStatus.DONE
+
+class fake_rhapi():
+
+    def __init__(self, pilots:dict, heats:dict, options:dict=None):
+        self.db = fake_db(pilots, heats, options)
+        self.ui = fake_ui()
+        self.language = fake_language()
+        self.race = fake_race()
+
+    def __(self, text):
+        return text
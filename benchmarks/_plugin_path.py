@@ -0,0 +1,29 @@
+"""
+Makes the plugin's modules importable as plugins.VRxC_ELRS.* from a plain
+checkout, without running the plugin's __init__.py (which needs the
+RotorHazard server).
+"""
+
+import os
+import sys
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def install():
+    if 'plugins.VRxC_ELRS' in sys.modules:
+        return
+
+    try:
+        import plugins
+    except ImportError:
+        plugins = types.ModuleType('plugins')
+        plugins.__path__ = []
+        sys.modules['plugins'] = plugins
+
+    package = types.ModuleType('plugins.VRxC_ELRS')
+    package.__path__ = [REPO_DIR]
+    sys.modules['plugins.VRxC_ELRS'] = package
+    plugins.VRxC_ELRS = package
+
+install()
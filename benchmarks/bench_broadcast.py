@@ -0,0 +1,137 @@
+"""
+Frames-per-event benchmark for race-wide OSD messages.
+
+Drives the real elrsBackpack through the fake RHAPI and the replay's
+simulated serial sink, firing the race-wide events (stage, an
+announcement and race stop) at a heat of HDZero or mixed
+HDZero/craftname pilots. Each heat runs twice: once through
+elrsBackpack.broadcast as shipped, and once with broadcast replaced by
+one submitted transaction per pilot, as before the broadcast path. For
+each event it reports the queue items, frames, bytes and SET_SEND_UID
+frames that reached the wire.
+
+    python benchmarks/bench_broadcast.py [--pilots 1,2,4,8] [--mix hdzero,mixed]
+        [--repeat 0] [--full-rows]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import _plugin_path
+import _fake_rh
+
+_fake_rh.install()
+
+from plugins.VRxC_ELRS.elrsBackpack import elrsBackpack
+from plugins.VRxC_ELRS.msp import msptypes, msp_parser
+
+from bench_replay import uart_sink, make_pilots, mix_list
+
+# Quiet time after which an event's frames are taken to be on the wire,
+# longer than the one second steps of an animated craftname message
+QUIET_TIME = 1.5
+
+class recording_sink(uart_sink):
+    '''
+    Simulated serial port that also keeps everything written, so the
+    frames of each event can be decoded and counted.
+    '''
+
+    def __init__(self):
+        super().__init__()
+        self.written = bytearray()
+
+    def write(self, data):
+        self.written += data
+        return super().write(data)
+
+def per_pilot(controller):
+    # The submission path broadcast replaced: one transaction and queue item per pilot
+    def submit(targets, build, priority, key, event_time=None):
+        for target in targets:
+            txn = controller.begin_transaction(target, priority, (key, target.pilot_id), event_time)
+            build(txn, target)
+            controller.submit_transaction(txn)
+    return submit
+
+def wait_quiet(controller, sink):
+    time.sleep(0.1)
+    while True:
+        quiet = sink.last_write is None or time.monotonic() - sink.last_write > QUIET_TIME
+        if quiet and controller._links.empty() and not controller._scheduler.stats()['queue_depth']:
+            return
+        time.sleep(0.05)
+
+def measure(controller, sink, fire) -> tuple:
+    items = controller._metrics.snapshot()['items_sent']
+    start = len(sink.written)
+    fire()
+    wait_quiet(controller, sink)
+
+    frames = msp_parser(directions=b'<').feed(bytes(sink.written[start:]))
+    uids = sum(1 for function, _ in frames if function == msptypes.MSP_ELRS_SET_SEND_UID)
+    sent = controller._metrics.snapshot()['items_sent'] - items
+    return sent, len(frames), len(sink.written) - start, uids
+
+def run(count, mix, path, options) -> dict:
+    pilots = make_pilots(count, mix, random.Random(options.seed))
+    settings = {
+        '_bp_repeat'            : options.repeat,
+        '_osd_full_rows'        : '1' if options.full_rows else '0',
+        # No clear may fire while an event is measured
+        '_announcement_uptime'  : 6000,
+        '_racestart_uptime'     : 6000,
+    }
+    rhapi = _fake_rh.fake_rhapi(pilots, {1: list(pilots)}, settings)
+
+    controller = elrsBackpack('elrs', 'ELRS', rhapi, autoconnect=False)
+    controller.setOptions()
+    if path == 'per-pilot':
+        controller.broadcast = per_pilot(controller)
+
+    sink = recording_sink()
+    link = threading.Thread(target=controller.run_link, args=(sink,), daemon=True)
+    link.start()
+    while not controller._links.links():
+        time.sleep(0.01)
+    controller.onHeatSet({'heat_id': 1})
+
+    results = {}
+    for event, fire in (
+        ('stage', lambda: controller.onRaceStage({'heat_id': 1})),
+        ('announcement', lambda: controller.onSendMessage({'message': 'PITS CLOSE IN 1 MIN'})),
+        ('stop', lambda: controller.onRaceStop({})),
+    ):
+        results[event] = measure(controller, sink, fire)
+
+    controller.reset_link()
+    link.join(2)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Frames per race-wide event, broadcast against per-pilot submission')
+    parser.add_argument('--pilots', default='1,2,4,8')
+    parser.add_argument('--mix', default='hdzero,mixed', type=mix_list)
+    parser.add_argument('--repeat', type=int, default=0, help='_bp_repeat')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--full-rows', action='store_true', help='disable diff-based row updates')
+    options = parser.parse_args()
+
+    print(f"repeat {options.repeat}, {'full-row' if options.full_rows else 'diff'} updates")
+    print(f"{'heat':<14} {'event':<13} {'path':<10} {'items':>6} {'frames':>7} {'bytes':>7} {'uid frames':>11}")
+    for count in (int(value) for value in options.pilots.split(',')):
+        for mix in options.mix:
+            runs = {path: run(count, mix, path, options) for path in ('per-pilot', 'broadcast')}
+            for event in runs['broadcast']:
+                for path, results in runs.items():
+                    items, frames, size, uids = results[event]
+                    print(f"{f'{count} {mix}':<14} {event:<13} {path:<10} {items:>6} {frames:>7} {size:>7} {uids:>11}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Micro-benchmark for MSP frame encoding.
+
+Compares the original list-based msp_message encoder (bitwise CRC, list
+concatenation) with the table-driven encoder in msp.py for the frames
+the plugin sends most often.
+
+    python benchmarks/bench_msp.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from msp import msptypes, msp_message, encode_msp
+
+#
+# Reference implementation (list-based, bit-by-bit CRC)
+#
+
+class legacy_msp_message():
+
+    _payload = []
+
+    def _convert_values(self, value):
+        a = value%256
+        b = int(value/256)
+        return [a, b]
+
+    def set_function(self, function):
+        self._function = self._convert_values(function)
+
+    def set_payload(self, payload:list):
+        self._payload = payload
+
+    def _payload_size(self):
+        size = len(self._payload)
+        return self._convert_values(size)
+
+    def _crc8_dvb_s2(self, crc, a):
+        crc = crc ^ a
+        for ii in range(8):
+            if crc & 0x80:
+                crc = (crc << 1) ^ 0xD5
+            else:
+                crc = crc << 1
+        return crc & 0xFF
+
+    def _calculate_checksum(self, body):
+        crc = 0
+        for x in body:
+            crc = self._crc8_dvb_s2(crc, x)
+        return crc
+
+    def get_msp(self):
+        msp = [ord('$'), ord('X'), ord('<')]
+
+        body = [0]
+        body += self._function
+        body += self._payload_size()
+        body += self._payload
+
+        checksum = self._calculate_checksum(body)
+        msp += body + [checksum]
+        return msp
+
+#
+# Typical frames
+#
+
+UID = [0x42, 0x1f, 0x9a, 0x03, 0x77, 0x10]
+
+FRAMES = {
+    'SET_OSD clear row' : (msptypes.MSP_ELRS_SET_OSD, [0x03, 5, 0, 0] + [0] * 50),
+    'SET_OSD text'      : (msptypes.MSP_ELRS_SET_OSD, [0x03, 0, 16, 0] + [ord(c) for c in 'POSN: 2 | LAP: 4']),
+    'SET_OSD display'   : (msptypes.MSP_ELRS_SET_OSD, [0x04]),
+    'SET_NAME'          : (msptypes.MSP_ELRS_SET_NAME, [1] + [ord(c) for c in '  FINISH LAP!  ']),
+    'SET_SEND_UID'      : (msptypes.MSP_ELRS_SET_SEND_UID, [1] + UID),
+}
+
+def legacy(function, payload):
+    message = legacy_msp_message()
+    message.set_function(function)
+    message.set_payload(payload)
+    return message.get_msp()
+
+def current(function, payload):
+    message = msp_message()
+    message.set_function(function)
+    message.set_payload(payload)
+    return message.get_msp()
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+    print(f"{'frame':<20}{'legacy us':>12}{'msp_message us':>16}{'encode_msp us':>15}{'speedup':>10}")
+    for name, (function, payload) in FRAMES.items():
+        payload_bytes = bytes(payload)
+        assert bytes(legacy(function, payload)) == current(function, payload) == encode_msp(function, payload_bytes)
+
+        t_legacy = timeit.timeit(lambda: legacy(function, payload), number=iterations)
+        t_current = timeit.timeit(lambda: current(function, payload), number=iterations)
+        t_encode = timeit.timeit(lambda: encode_msp(function, payload_bytes), number=iterations)
+
+        scale = 1e6 / iterations
+        print(f"{name:<20}{t_legacy * scale:>12.2f}{t_current * scale:>16.2f}{t_encode * scale:>15.2f}{t_legacy / t_encode:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Fuzz and throughput benchmark for msp.msp_parser.
+
+Builds a byte stream like the one recorded from a TX backpack during a
+race (race-control packets, version responses and echoed OSD frames),
+injects line noise, corrupted checksums and truncated frames, and checks
+that every read chunk size recovers the same frames as feeding the whole
+stream at once. Intact frames lost to checksum collisions are reported.
+A pure random stream is fed through the parser as a crash test, then raw
+throughput is measured per chunk size.
+
+    python benchmarks/bench_parser.py [frames] [seed]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from msp import msptypes, msp_parser, encode_msp, crc8_dvb_s2
+
+def response(function, payload):
+    frame = bytearray(encode_msp(function, payload))
+    frame[2] = ord('>')
+    frame[-1] = crc8_dvb_s2(frame[3:-1])
+    return bytes(frame)
+
+def recorded_stream(count, rng):
+    # Returns the stream and the frames that a correct parser must recover
+    templates = [
+        lambda: encode_msp(msptypes.MSP_ELRS_BACKPACK_SET_RECORDING_STATE, [rng.choice((0, 1)), 0, 0]),
+        lambda: response(msptypes.MSP_ELRS_GET_BACKPACK_VERSION, b'1.4.1 (a1b2c3)'),
+        lambda: encode_msp(msptypes.MSP_ELRS_SET_OSD, bytes([0x03, rng.randrange(18), 0, 0]) + bytes(50)),
+        lambda: encode_msp(msptypes.MSP_ELRS_SET_SEND_UID, bytes([1]) + rng.randbytes(6)),
+    ]
+
+    stream = bytearray()
+    expected = []
+    for _ in range(count):
+        frame = rng.choice(templates)()
+        fault = rng.random()
+        if fault < 0.05:
+            # corrupted checksum
+            stream += frame[:-1] + bytes([frame[-1] ^ 0xFF])
+        elif fault < 0.10:
+            # truncated frame
+            stream += frame[:rng.randrange(3, len(frame) - 1)]
+        else:
+            stream += frame
+            expected.append((frame[4] | (frame[5] << 8), frame[8:-1]))
+
+        if rng.random() < 0.2:
+            # line noise without header bytes
+            stream += bytes(rng.choice(b'abcdefghij\x00\xff\r\n') for _ in range(rng.randrange(1, 16)))
+
+    # Trailing padding flushes a partially buffered truncated frame
+    stream += bytes(2048)
+    return bytes(stream), expected
+
+def feed(stream, chunk_sizes, rng):
+    parser = msp_parser()
+    frames = []
+    index = 0
+    while index < len(stream):
+        size = rng.choice(chunk_sizes)
+        frames += parser.feed(stream[index:index + size])
+        index += size
+    return parser, frames
+
+def match_frames(frames, expected) -> tuple:
+    # Returns (intact frames found, frames that are none of them), matching in stream order
+    position = 0
+    recovered = 0
+    spurious = 0
+    for frame in frames:
+        try:
+            position = expected.index(frame, position) + 1
+        except ValueError:
+            spurious += 1
+        else:
+            recovered += 1
+    return recovered, spurious
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    seed = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    rng = random.Random(seed)
+
+    stream, expected = recorded_stream(count, rng)
+    expected_ids = [(function, bytes(payload)) for function, payload in expected]
+
+    print(f"stream: {len(stream)} bytes, {count} frames, {len(expected)} intact")
+
+    # A CRC8 match on corrupted bytes can yield a bogus frame and swallow a real one, so the
+    # one-shot result is reported against the intact frames rather than required to equal them
+    reference = msp_parser().feed(stream)
+    recovered, spurious = match_frames(reference, expected_ids)
+    print(f"  one-shot: recovered {recovered} of {len(expected_ids)}, {spurious} spurious frames from checksum collisions")
+
+    # Recovery must not depend on where reads split the stream
+    for chunk_sizes in ((1,), (8,), (64,), (4096,), (1, 3, 7, 9, 64, 200)):
+        parser, frames = feed(stream, chunk_sizes, rng)
+        assert frames == reference, f'chunks {chunk_sizes}: {len(frames)} frames, one-shot feed gave {len(reference)}'
+        print(f"  chunks {str(chunk_sizes):<24} ok   crc errors {parser.crc_errors:>5}   discarded {parser.discarded:>7} bytes")
+
+    # Pure noise must never raise or yield a frame with a bad checksum
+    noise = rng.randbytes(1 << 20)
+    parser, frames = feed(noise, (1, 17, 256, 4096), rng)
+    print(f"  random noise {len(noise)} bytes: {len(frames)} frames, {parser.crc_errors} crc errors")
+
+    print("throughput:")
+    for chunk in (1, 8, 64, 4096):
+        parser = msp_parser()
+        start = time.perf_counter()
+        for index in range(0, len(stream), chunk):
+            parser.feed(stream[index:index + chunk])
+        elapsed = time.perf_counter() - start
+        print(f"  chunk {chunk:>5} bytes: {len(stream) / elapsed / 1e6:6.2f} MB/s   {parser.frames / elapsed:>10.0f} frames/s")
+
+if __name__ == '__main__':
+    main()
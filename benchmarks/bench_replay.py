@@ -0,0 +1,322 @@
+"""
+Replay benchmark for race event storms.
+
+Runs the real elrsBackpack event handlers against a fake RHAPI and a
+simulated serial sink that drains at the backpack's UART rate, replaying
+synthetic races generated from a seed: staging, start, every lap of every
+pilot, pilots finishing, race finish and stop. For each heat size and
+hardware mix it reports frames and bytes written, event-to-wire latency
+(p95 and max, per message kind) and the peak number of threads.
+
+The race timeline is compressed by --speed; the plugin's message uptimes
+are scaled with it so clears overlap laps the way they would at full
+length. The replay runs on the wall clock with the plugin's real threads,
+so the races repeat for a seed but the measured timings vary from run to
+run.
+
+    python benchmarks/bench_replay.py [--pilots 8,16] [--mix hdzero,mixed]
+        [--laps 3] [--speed 4] [--seed 1] [--delay 80] [--repeat 0]
+        [--transport selector|polling] [--full-rows]
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import _plugin_path
+import _fake_rh
+
+_fake_rh.install()
+
+from plugins.VRxC_ELRS.elrsBackpack import elrsBackpack
+
+#
+# Simulated serial port
+#
+
+class uart_sink():
+    '''
+    Serial port stand-in. Written bytes drain at the line rate through a
+    buffer of buffer_size bytes; writes block while the buffer is full and
+    out_waiting reports what has not been sent yet. Nothing is ever
+    received, but fileno() is selectable so either transport can run.
+    '''
+
+    def __init__(self, baudrate=460800, buffer_size=4096):
+        self._rate = baudrate / 10
+        self._buffer_size = buffer_size
+        self._lock = threading.Lock()
+        self._drained_at = time.monotonic()
+        self._read_fd, self._write_fd = os.pipe()
+        os.set_blocking(self._read_fd, False)
+
+        self.frames = 0
+        self.bytes = 0
+        self.last_write = None
+        self.port = 'sim'
+
+    def fileno(self):
+        return self._read_fd
+
+    @property
+    def in_waiting(self):
+        return 0
+
+    @property
+    def out_waiting(self):
+        with self._lock:
+            return max(0, int((self._drained_at - time.monotonic()) * self._rate))
+
+    def read(self, size=1):
+        try:
+            return os.read(self._read_fd, size)
+        except BlockingIOError:
+            return b''
+
+    def write(self, data):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._drained_at)
+            self._drained_at = start + len(data) / self._rate
+            backlog = (self._drained_at - now) * self._rate
+            wait = (backlog - self._buffer_size) / self._rate
+            self.frames += data.count(b'$X<')
+            self.bytes += len(data)
+            self.last_write = now
+        if wait > 0:
+            time.sleep(wait)
+        return len(data)
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+#
+# Synthetic races
+#
+
+class _record():
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+def make_pilots(count, mix, rng):
+    pilots = {}
+    for pilot_id in range(1, count + 1):
+        if mix == 'hdzero':
+            hardware = 'hdzero'
+        elif mix == 'craftname':
+            hardware = 'betaflight_craftname'
+        else:
+            hardware = rng.choice(('hdzero', 'betaflight_craftname'))
+        pilots[pilot_id] = {
+            'callsign'      : f'PILOT{pilot_id}',
+            'hardware_type' : hardware,
+            'comm_elrs'     : f'bind-{pilot_id}' if pilot_id % 3 else None,
+        }
+    return pilots
+
+def make_timeline(pilots, laps, rng):
+    # [(race time in seconds, pilot_id, lap number)], lap 0 is the holeshot
+    events = []
+    for pilot_id in pilots:
+        base = rng.uniform(3.0, 5.0)
+        now = rng.uniform(0.3, 1.0)
+        events.append((now, pilot_id, 0))
+        for lap in range(1, laps + 1):
+            now += base * rng.uniform(0.9, 1.15)
+            events.append((now, pilot_id, lap))
+    return sorted(events)
+
+def standings(state):
+    # Positions by laps completed, then by time of the last lap
+    ordered = sorted(state.items(), key=lambda item: (-item[1]['laps'], item[1]['time']))
+    results = []
+    for position, (pilot_id, pilot) in enumerate(ordered, start=1):
+        fastest = min(pilot['lap_times']) if pilot['lap_times'] else 0
+        results.append({
+            'pilot_id'          : pilot_id,
+            'callsign'          : f'PILOT{pilot_id}',
+            'position'          : position,
+            'laps'              : pilot['laps'],
+            'fastest_lap'       : _fake_rh._time_format(fastest * 1000),
+            'consecutives_base' : 3,
+            'consecutives'      : _fake_rh._time_format(sum(pilot['lap_times'][-3:]) * 1000),
+            'total_time'        : _fake_rh._time_format(pilot['time'] * 1000),
+        })
+    return results
+
+def gap_info(results, pilot_id, state):
+    index = next(index for index, result in enumerate(results) if result['pilot_id'] == pilot_id)
+    pilot = state[pilot_id]
+    current = _record(lap_number=pilot['laps'], last_lap_time=(pilot['lap_times'] or [0])[-1] * 1000)
+    if index:
+        ahead = results[index - 1]
+        diff = (pilot['time'] - state[ahead['pilot_id']]['time']) * 1000
+        next_rank = _record(position=ahead['position'], callsign=ahead['callsign'], diff_time=max(0, diff))
+    else:
+        next_rank = _record(position=None, callsign=None, diff_time=0)
+    return _record(current=current, next_rank=next_rank)
+
+#
+# Replay
+#
+
+class thread_sampler():
+
+    def __init__(self, interval=0.02):
+        self.peak = threading.active_count()
+        self._running = True
+        self._interval = interval
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while self._running:
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self._interval)
+
+    def stop(self):
+        self._running = False
+        self._thread.join()
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def replay(count, mix, options):
+    rng = random.Random(options.seed * 1000 + count)
+    pilots = make_pilots(count, mix, rng)
+    timeline = make_timeline(pilots, options.laps, rng)
+
+    speed = options.speed
+    settings = {
+        '_bp_delay'             : options.delay,
+        '_bp_repeat'            : options.repeat,
+        '_bp_transport'         : options.transport,
+        '_osd_full_rows'        : '1' if options.full_rows else '0',
+    }
+    for name in ('_racestart_uptime', '_finish_uptime', '_results_uptime', '_announcement_uptime'):
+        settings[name] = _fake_rh.OPTION_DEFAULTS[name] / speed
+
+    rhapi = _fake_rh.fake_rhapi(pilots, {1: list(pilots)}, settings)
+    sampler = thread_sampler()
+    baseline_threads = threading.active_count()
+
+    controller = elrsBackpack('elrs', 'ELRS', rhapi, autoconnect=False)
+    controller._metrics.RECENT_SIZE = 1 << 20
+    controller._metrics.reset()
+    controller.setOptions()
+
+    sink = uart_sink()
+    link = threading.Thread(target=controller.run_link, args=(sink,), daemon=True)
+    link.start()
+    while not controller._links.links():
+        time.sleep(0.01)
+
+    controller.onHeatSet({'heat_id': 1})
+    controller.onRaceStage({'heat_id': 1})
+    time.sleep(1.0 / speed)
+    started = time.monotonic()
+    controller.onRaceStart({})
+
+    state = {pilot_id: {'laps': 0, 'time': 0, 'lap_times': []} for pilot_id in pilots}
+    finished = False
+    for race_time, pilot_id, lap in timeline:
+        delay = started + race_time / speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+        pilot = state[pilot_id]
+        if lap:
+            pilot['lap_times'].append(race_time - pilot['time'])
+            pilot['laps'] = lap
+        pilot['time'] = race_time
+
+        done = lap == options.laps
+        results = standings(state)
+        controller.onRaceLapRecorded({
+            'pilot_id'          : pilot_id,
+            'pilot_done_flag'   : done,
+            'results'           : {'by_race_time': results},
+            'gap_info'          : gap_info(results, pilot_id, state),
+        })
+
+        if done:
+            controller.onRacePilotDone({'pilot_id': pilot_id, 'results': {'by_race_time': results}})
+            if not finished:
+                finished = True
+                controller.onRaceFinish({})
+
+    controller.onRaceStop({})
+
+    # Let the queue drain and the UART go quiet
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        idle = sink.last_write is None or time.monotonic() - sink.last_write > 0.5
+        if controller._links.empty() and idle:
+            break
+        time.sleep(0.05)
+
+    sampler.stop()
+    controller.reset_link()
+    link.join(2)
+
+    snapshot = controller._metrics.snapshot()
+    latencies = {}
+    for delivery in snapshot['recent']:
+        latencies.setdefault(delivery['kind'], []).append((delivery['written'] - delivery['event']) * 1e3)
+
+    return {
+        'frames'        : sink.frames,
+        'bytes'         : sink.bytes,
+        'items'         : snapshot['items_sent'],
+        'dropped'       : snapshot['dropped'],
+        'latencies'     : latencies,
+        'threads'       : sampler.peak - baseline_threads,
+        'db_queries'    : rhapi.db.queries,
+    }
+
+MIXES = ('hdzero', 'craftname', 'mixed')
+
+def mix_list(value) -> list:
+    mixes = value.split(',')
+    unknown = [mix for mix in mixes if mix not in MIXES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown mix {', '.join(unknown)}, choose from {', '.join(MIXES)}")
+    return mixes
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay synthetic races through the ELRS backpack plugin')
+    parser.add_argument('--pilots', default='8,16')
+    parser.add_argument('--mix', default='hdzero,mixed', type=mix_list, help=f"comma-separated, any of {', '.join(MIXES)}")
+    parser.add_argument('--laps', type=int, default=3)
+    parser.add_argument('--speed', type=float, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--delay', type=int, default=80, help='_bp_delay, tens of microseconds')
+    parser.add_argument('--repeat', type=int, default=0, help='_bp_repeat')
+    parser.add_argument('--transport', default='selector', choices=('selector', 'polling'))
+    parser.add_argument('--full-rows', action='store_true', help='disable diff-based row updates')
+    options = parser.parse_args()
+
+    print(f"laps {options.laps}, speed x{options.speed}, delay {options.delay}, repeat {options.repeat}, {options.transport} transport")
+    for count in (int(value) for value in options.pilots.split(',')):
+        for mix in options.mix:
+            result = replay(count, mix, options)
+            print(f"\n{count} pilots, {mix}: {result['frames']} frames, {result['bytes']} bytes, "
+                  f"{result['items']} queue items, {result['dropped']} dropped, "
+                  f"+{result['threads']} threads, {result['db_queries']} db queries")
+            everything = []
+            for kind, values in sorted(result['latencies'].items()):
+                everything += values
+                print(f"  {kind:<14} {len(values):>5} updates   p95 {percentile(values, 0.95):8.1f} ms   max {max(values):8.1f} ms")
+            print(f"  {'all':<14} {len(everything):>5} updates   p95 {percentile(everything, 0.95):8.1f} ms   max {max(everything, default=0):8.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+Loopback harness for the backpack transports over a pseudo-terminal.
+
+The transport under test owns the pty's slave end through pyserial, the
+harness plays the backpack on the master end. It measures how long an
+outbound transaction takes to reach the "backpack" and how long an
+inbound SET_RECORDING_STATE packet takes to reach the packet callback.
+
+    python benchmarks/pty_loopback.py [rounds]
+
+Requires pyserial and a POSIX system.
+"""
+
+import os
+import select
+import statistics
+import sys
+import time
+
+from threading import Thread, Event
+
+import _plugin_path
+import serial
+
+from plugins.VRxC_ELRS.msp import msptypes, encode_msp
+from plugins.VRxC_ELRS.sendqueue import priority_send_queue, sendPriority
+from plugins.VRxC_ELRS.transport import polling_transport, selector_transport
+
+def open_pty():
+    master, slave = os.openpty()
+    port = serial.Serial(os.ttyname(slave), baudrate=460800, timeout=0.01)
+    os.close(slave)
+    return master, port
+
+def read_exact(fd, size, timeout=1.0):
+    data = bytearray()
+    deadline = time.monotonic() + timeout
+    while len(data) < size:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f'received {len(data)} of {size} bytes')
+        ready, _, _ = select.select([fd], [], [], remaining)
+        if ready:
+            data += os.read(fd, size - len(data))
+    return bytes(data)
+
+def run(transport_class, rounds):
+    master, port = open_pty()
+    send_queue = priority_send_queue()
+    received = Event()
+
+    def on_packet(mode, payload):
+        if mode == msptypes.MSP_ELRS_BACKPACK_SET_RECORDING_STATE:
+            received.set()
+
+    transport = transport_class(port, send_queue, on_packet, lambda: (0, 0))
+    thread = Thread(target=transport.run, daemon=True)
+    thread.start()
+
+    frame = encode_msp(msptypes.MSP_ELRS_SET_OSD, [0x04])
+    command = encode_msp(msptypes.MSP_ELRS_BACKPACK_SET_RECORDING_STATE, [0x01, 0x00, 0x00])
+
+    outbound = []
+    inbound = []
+    for _ in range(rounds):
+        time.sleep(0.005)
+
+        start = time.perf_counter()
+        send_queue.put((frame,), sendPriority.STATUS)
+        transport.notify()
+        assert read_exact(master, len(frame)) == frame
+        outbound.append(time.perf_counter() - start)
+
+        time.sleep(0.005)
+
+        received.clear()
+        start = time.perf_counter()
+        os.write(master, command)
+        if not received.wait(1.0):
+            raise TimeoutError('inbound packet not delivered')
+        inbound.append(time.perf_counter() - start)
+
+    transport.stop()
+    thread.join(2)
+    port.close()
+    os.close(master)
+    return outbound, inbound
+
+def summary(samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    return f"median {statistics.median(samples) * 1e3:6.2f} ms   p95 {p95 * 1e3:6.2f} ms   max {samples[-1] * 1e3:6.2f} ms"
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+
+    for transport_class in (polling_transport, selector_transport):
+        outbound, inbound = run(transport_class, rounds)
+        print(transport_class.__name__)
+        print(f"  outbound  {summary(outbound)}")
+        print(f"  inbound   {summary(inbound)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+from functools import lru_cache
+
+from plugins.VRxC_ELRS.msp import msptypes, encode_msp
+
+#
+# Betaflight craftname messages
+#
+
+CRAFTNAME_LENGTH = 16
+SCROLL_INTERVAL = 0.4
+
+def craftname_steps(text:str) -> list:
+    # Text shown at each scroll step; messages that fit are centered and shown once
+    steps = []
+    while True:
+        if len(text) > CRAFTNAME_LENGTH:
+            text = text.replace('>>', '')
+            text = text.replace('<<', '')
+
+        text = text.strip()
+
+        if len(text) < CRAFTNAME_LENGTH:
+            text = (' ' * int((CRAFTNAME_LENGTH - len(text)) / 2)) + text
+
+        steps.append(text[:CRAFTNAME_LENGTH])
+        if len(text) <= CRAFTNAME_LENGTH:
+            return steps
+        text = text[1:]
+
+@lru_cache(maxsize=128)
+def craftname_frames(text:str) -> tuple:
+    # SET_NAME frames for every scroll step, encoded once per message
+    return tuple(
+        encode_msp(msptypes.MSP_ELRS_SET_NAME, [1] + [ord(char) for char in step])
+        for step in craftname_steps(text)
+    )
@@ -0,0 +1,248 @@
+import logging
+import json
+import os
+import time
+
+from threading import Thread, Event, Lock
+
+import serial
+import serial.tools.list_ports
+
+from plugins.VRxC_ELRS.msp import msptypes, msp_parser, encode_msp
+
+logger = logging.getLogger(__name__)
+
+#
+# Backpack discovery
+#
+
+# USB-serial bridges found on ESP32/ESP8266 boards running the backpack
+KNOWN_BACKPACK_IDS = {
+    (0x10C4, 0xEA60), # CP210x
+    (0x1A86, 0x7523), # CH340
+    (0x1A86, 0x55D4), # CH9102
+    (0x303A, 0x1001), # ESP32-S3/C3 native USB
+    (0x0403, 0x6001), # FT232R
+}
+
+VERSION_REQUEST = encode_msp(msptypes.MSP_ELRS_GET_BACKPACK_VERSION)
+
+CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backpack_cache.json')
+
+def open_port(device:str) -> serial.Serial:
+    s = serial.Serial(baudrate=460800,
+                    bytesize=8, parity='N', stopbits=1,
+                    timeout=0.01, xonxoff=0, rtscts=0)
+    s.port = device
+    s.open()
+    return s
+
+def read_response(s, timeout=0.1):
+    # Wait for the first valid MSP response frame from the device
+    parser = msp_parser(directions=b'>')
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        frames = parser.feed(s.read(max(1, s.in_waiting)))
+        if frames:
+            return frames[0]
+    return None
+
+def handshake(s, ready_timeout=3.0, retry_interval=0.1, cancel:Event=None):
+    # Repeat the version request until the device answers, instead of
+    # sleeping a fixed time for boards that reset when the port opens
+    deadline = time.monotonic() + ready_timeout
+    while time.monotonic() < deadline:
+        if cancel is not None and cancel.is_set():
+            return None
+
+        s.write(VERSION_REQUEST)
+        response = read_response(s, retry_interval)
+        if response is None:
+            continue
+
+        mode, payload = response
+        if mode == msptypes.MSP_ELRS_BACKPACK_SET_MODE or mode == msptypes.MSP_ELRS_GET_BACKPACK_VERSION:
+            return ''.join(chr(val) for val in payload)
+
+        logger.warning(f"Unexpected response from {s.port}: {mode:#06x}")
+        return None
+
+    return None
+
+def is_known_backpack(port) -> bool:
+    return (port.vid, port.pid) in KNOWN_BACKPACK_IDS
+
+def candidate_ports() -> list:
+    ports = list(serial.tools.list_ports.comports())
+    # Known backpack bridges are probed first
+    return sorted(ports, key=lambda port: not is_known_backpack(port))
+
+def find_backpack(ports=None, ready_timeout=3.0):
+    '''
+    Probes all candidate ports concurrently. Returns (serial, port, version)
+    for the first port that answers the version request, or None.
+    '''
+    backpacks = probe_ports(ports, ready_timeout, first_only=True)
+    if backpacks:
+        return backpacks[0]
+    return None
+
+def find_backpacks(ports=None, ready_timeout=3.0) -> list:
+    # Like find_backpack(), but keeps every port that answers
+    return probe_ports(ports, ready_timeout, first_only=False)
+
+def probe_ports(ports, ready_timeout, first_only) -> list:
+    if ports is None:
+        ports = candidate_ports()
+
+    found = Event()
+    result_lock = Lock()
+    result = []
+
+    def probe(port):
+        try:
+            s = open_port(port.device)
+        except Exception:
+            logger.warning(f'Failed to open serial device {port.device}')
+            return
+
+        try:
+            version = handshake(s, ready_timeout, cancel=found)
+        except Exception:
+            logger.warning(f'Failed to communicate with serial device {port.device}')
+            version = None
+
+        if version is not None:
+            with result_lock:
+                if not (first_only and result):
+                    result.append((s, port, version))
+                    if first_only:
+                        found.set()
+                    return
+
+        s.close()
+        if version is None:
+            logger.info(f"No backpack response from {port.device}")
+
+    threads = []
+    for port in ports:
+        thread = Thread(target=probe, args=(port,), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    for thread in threads:
+        thread.join()
+
+    return result
+
+#
+# Discovery cache
+#
+
+def load_cache(path=CACHE_FILE) -> dict:
+    try:
+        with open(path, 'r') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(cache, dict):
+        return {}
+    return cache
+
+def save_cache(port, version:str, path=CACHE_FILE):
+    cache = {
+        'device'        : port.device,
+        'serial_number' : getattr(port, 'serial_number', None),
+        'vid'           : getattr(port, 'vid', None),
+        'pid'           : getattr(port, 'pid', None),
+        'version'       : version,
+    }
+    try:
+        with open(path, 'w') as cache_file:
+            json.dump(cache, cache_file)
+    except OSError:
+        logger.warning(f'Unable to write backpack cache to {path}')
+
+def cached_port(cache:dict, ports:list):
+    # Match by USB serial number, as device names can change between boots and
+    # whatever now sits at the cached name may be another device
+    serial_number = cache.get('serial_number')
+    if serial_number:
+        for port in ports:
+            if getattr(port, 'serial_number', None) == serial_number:
+                return port
+        return None
+
+    # Devices without a serial number can only be matched by name
+    for port in ports:
+        if port.device == cache.get('device') and not getattr(port, 'serial_number', None):
+            return port
+
+    return None
+
+def connect_backpack(ready_timeout=3.0, skip=()):
+    '''
+    Tries the last known-good port first and falls back to a full scan if
+    its handshake fails. Devices listed in skip are never probed, the
+    cached one included. A successful connection refreshes the cache.
+
+    Returns ((serial, port, version) or None, list of probed devices).
+    '''
+    ports = [port for port in candidate_ports() if port.device not in skip]
+
+    cache = load_cache()
+    port = cached_port(cache, ports) if cache else None
+    if port is not None:
+        logger.info(f"Trying cached backpack port {port.device}")
+        backpack = find_backpack([port], ready_timeout)
+        if backpack:
+            if backpack[2] != cache.get('version') or port.device != cache.get('device'):
+                save_cache(backpack[1], backpack[2])
+            return backpack, [port.device]
+        logger.info("Cached backpack port did not respond, scanning all ports")
+
+    # The cached port has had its chance, it is reported as probed with the rest
+    scan = [candidate for candidate in ports if candidate is not port]
+    backpack = find_backpack(scan, ready_timeout) if scan else None
+    if backpack:
+        save_cache(backpack[1], backpack[2])
+    return backpack, [candidate.device for candidate in ports]
+
+def connect_more_backpacks(ready_timeout=3.0, skip=()):
+    '''
+    Scans the ports not listed in skip for further backpacks, for running
+    several at once. Like connect_backpack(), the last known-good port is
+    tried first, and the first backpack found is remembered unless the
+    cached one answered or is already in skip. Returns (list of (serial,
+    port, version), list of probed devices).
+    '''
+    candidates = candidate_ports()
+    ports = [port for port in candidates if port.device not in skip]
+    if not ports:
+        return [], []
+
+    cache = load_cache()
+    # The cached backpack is most likely one of the links already running
+    remembered = bool(cache) and cached_port(cache, candidates) is not None
+    port = cached_port(cache, ports) if cache else None
+
+    found = []
+    if port is not None:
+        remembered = False
+        logger.info(f"Trying cached backpack port {port.device}")
+        backpack = find_backpack([port], ready_timeout)
+        if backpack:
+            if backpack[2] != cache.get('version') or port.device != cache.get('device'):
+                save_cache(backpack[1], backpack[2])
+            remembered = True
+            found.append(backpack)
+
+    scan = [candidate for candidate in ports if candidate is not port]
+    if scan:
+        found += find_backpacks(scan, ready_timeout)
+    if found and not remembered:
+        save_cache(found[0][1], found[0][2])
+    return found, [candidate.device for candidate in ports]
+
+def present_devices() -> set:
+    return {port.device for port in serial.tools.list_ports.comports()}
@@ -1,13 +1,12 @@
 import logging
-import hashlib
-import serial
+import json
+import os
 import time
-import copy
 
-from threading import Thread, Lock
+from threading import Thread, Lock, RLock, Event
+from collections import OrderedDict
+from functools import partial
 import queue
-import serial.tools.list_ports
-import gevent
 
 import RHUtils
 from RHRace import RaceStatus
@@ -16,101 +15,144 @@ from RHGPIO import RealRPiGPIOFlag
 if RealRPiGPIOFlag:
     import RPi.GPIO as GPIO
 
-from plugins.VRxC_ELRS.hardware import HARDWARE_SETTINGS
-from plugins.VRxC_ELRS.msp import msptypes, msp_message
+from plugins.VRxC_ELRS.hardware import hardwareOptions, HARDWARE_SETTINGS
+from plugins.VRxC_ELRS.msp import msptypes, msp_message, msp_frame_cache, encode_msp
+from plugins.VRxC_ELRS.transaction import osd_transaction, merge_transactions
+from plugins.VRxC_ELRS.framebuffer import osd_framebuffer
+from plugins.VRxC_ELRS.scheduler import osd_scheduler
+from plugins.VRxC_ELRS.sendqueue import priority_send_queue, sendPriority
+from plugins.VRxC_ELRS.transport import create_transport
+from plugins.VRxC_ELRS.pacing import send_pacer
+from plugins.VRxC_ELRS.metrics import delivery_metrics, tracked_frames, format_metrics
+from plugins.VRxC_ELRS.discovery import connect_backpack, connect_more_backpacks, present_devices
+from plugins.VRxC_ELRS.links import backpack_link, link_pool
+from plugins.VRxC_ELRS.craftname import craftname_frames, SCROLL_INTERVAL
+from plugins.VRxC_ELRS.templates import osd_glyphs, osd_line, osd_template
+from plugins.VRxC_ELRS.options import osd_options, OPTION_DEFAULTS
+from plugins.VRxC_ELRS.racecontrol import command_debounce, hub_dispatcher
+from plugins.VRxC_ELRS.pilots import pilot_target, phrase_uid, resolve_hardware, carry_over
 
 logger = logging.getLogger(__name__)
 
 class elrsBackpack(VRxController):
     
     _queue_lock = Lock()
-    _delay_lock = Lock()
     _connector_status_lock = Lock()
-    _repeat_count = 0
-    _send_delay = 0.05
+    _options_lock = Lock()
+    # Re-entrant, a clear that runs under it cancels its own row's clear when it writes
+    _clear_lock = RLock()
+
+    RECONNECT_BACKOFF_MIN = 1
+    RECONNECT_BACKOFF_MAX = 30
+    RESCAN_INTERVAL = 30
+
+    # SET_RECORDING_STATE payload -> race control command
+    RACE_COMMANDS = {0x00: 'stop', 0x01: 'start'}
+    OFFLINE_BACKLOG_SIZE = 64
+    THROUGHPUT_INTERVAL = 5
+    METRICS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'osd_metrics.json')
 
-    _backpack_connected = False
-    
-    _heat_name = None
-    _heat_data = {}
     _finished_pilots = []
     _queue_full = False
 
-    # last persisten message per pilot(id)
-    _last_persistent_betaflight_craftname_message = {}
-    _activePilotIdentifier = None
+    # pilot_id -> pilot_target (None without a supported OSD), replaced as a whole on heat changes
+    _targets = {}
+    _targets_heat = None
+
+    # constant frames, encoded once
+    _DISPLAY_FRAME = encode_msp(msptypes.MSP_ELRS_SET_OSD, [0x04])
+    _CLEAR_FRAME = encode_msp(msptypes.MSP_ELRS_SET_OSD, [0x02])
+    _CLEAR_UID_FRAME = encode_msp(msptypes.MSP_ELRS_SET_SEND_UID, [0])
+
+    # lap event messages, their fixed text encoded once
+    _LAP_TEMPLATE = osd_template("LAP: {}")
+    _POSITION_TEMPLATE = osd_template("POSN: {} | LAP: {}")
+    _LAP_TIME_TEMPLATE = osd_template(">> LAP {} | {} <<")
+    _GAP_TEMPLATE = osd_template(">> {} | +{} <<")
 
-    def __init__(self, name, label, rhapi):
+    def __init__(self, name, label, rhapi, autoconnect=True):
         super().__init__(name, label)
         self._rhapi = rhapi
 
-        self._backpack_queue = queue.Queue(maxsize=200)
-        Thread(target=self.backpack_connector, daemon=True).start()
+        self._links = link_pool()
+        self._offline_backlog = OrderedDict()
+        self._framebuffers = {}
+        self._pilot_cache = {}
+        # (pilot_id, row) -> token of the one pending clear, guarded by _clear_lock
+        self._clear_tokens = {}
+        self._link_reset = Event()
+        self._link_event = Event()
+        self._frame_cache = msp_frame_cache(maxsize=256)
+        self._scheduler = osd_scheduler(workers=4)
+        self._pacer = send_pacer()
+
+        # Registered defaults until STARTUP loads the stored options
+        self._options = osd_options()
+        self._pacer.configure(self._options.send_delay, self._options.repeat_count)
+        self._metrics = delivery_metrics()
+        self._race_commands = command_debounce()
+        self._dispatcher = hub_dispatcher()
+        self._status_text = {}
+        # pilot_id -> position line last sent or pending, guarded by _queue_lock
+        self._positions_shown = {}
+        self._scheduler.schedule(self.THROUGHPUT_INTERVAL, self.report_status, key='status_report')
+
+        # Without autoconnect the owner hands a serial port to run_link() itself
+        if autoconnect:
+            Thread(target=self.backpack_connector, daemon=True).start()
 
     def registerHandlers(self, args):
         args['register_fn'](self)
 
-    def setOptions(self, _args = None):
-
-        self._queue_lock.acquire()
-
-        if self._rhapi.db.option('_heat_name') == "1":
-            self._heat_name = True
-        else:
-            self._heat_name = False
-        if self._rhapi.db.option('_position_mode') == "1":
-            self._position_mode = True
-        else:
-            self._position_mode = False
-        if self._rhapi.db.option('_gap_mode') == "1":
-            self._gap_mode = True
-        else:
-            self._gap_mode = False
-        if self._rhapi.db.option('_results_mode') == "1":
-            self._results_mode = True
-        else:
-            self._results_mode = False
-
-        self._racestage_message = self._rhapi.db.option('_racestage_message')
-        self._racestart_message = self._rhapi.db.option('_racestart_message')
-        self._pilotdone_message = self._rhapi.db.option('_pilotdone_message')
-        self._racefinish_message = self._rhapi.db.option('_racefinish_message')
-        self._racestop_message = self._rhapi.db.option('_racestop_message')
-        self._leader_message = self._rhapi.db.option('_leader_message')
-
-        self._racestart_uptime = self._rhapi.db.option('_racestart_uptime') * 1e-1
-        self._finish_uptime = self._rhapi.db.option('_finish_uptime') * 1e-1
-        self._results_uptime = self._rhapi.db.option('_results_uptime') * 1e-1
-        self._announcement_uptime = self._rhapi.db.option('_announcement_uptime') * 1e-1
-
-        self._status_row = self._rhapi.db.option('_status_row')
-        self._currentlap_row = self._rhapi.db.option('_currentlap_row')
-        self._lapresults_row = self._rhapi.db.option('_lapresults_row')
-        self._announcement_row = self._rhapi.db.option('_announcement_row')
+    def setOptions(self, args = None):
+        # OPTION_SET re-reads the one option that changed, anything else reloads them all
+        with self._options_lock:
+            name = args.get('option') if args else None
+            if name is None:
+                options = osd_options.load(self._rhapi.db)
+            elif name in OPTION_DEFAULTS:
+                options = self._options.replace(name, self._rhapi.db.option(name))
+            else:
+                return
 
-        self._repeat_count = self._rhapi.db.option('_bp_repeat')
-        with self._delay_lock:
-            self._send_delay = self._rhapi.db.option('_bp_delay') * 1e-5
+            if options is self._options:
+                return
+            self._options = options
 
-        self._queue_lock.release()
+            # With adaptive pacing the configured delay and repeat count are upper bounds
+            self._pacer.configure(options.send_delay, options.repeat_count, options.adaptive, options.min_delay)
 
-    def start_race(self):
-        if self._rhapi.db.option('_race_control') == '1':
+    def start_race(self) -> bool:
+        if self._options.race_control:
             start_race_args = {'start_time_s' : 10}
             if self._rhapi.race.status == RaceStatus.READY:
                 self._rhapi.race.stage(start_race_args)
+                return True
+        return False
 
-    def stop_race(self):
-        if self._rhapi.db.option('_race_control') == '1':
+    def stop_race(self) -> bool:
+        if self._options.race_control:
             status = self._rhapi.race.status
             if status == RaceStatus.STAGING or status == RaceStatus.RACING:
                 self._rhapi.race.stop()
+                return True
+        return False
+
+    def race_command(self, command, received):
+        # Runs in a greenlet on the server's hub
+        if command == 'start':
+            acted = self.start_race()
+        else:
+            acted = self.stop_race()
+        if acted:
+            self._metrics.record_command(command, time.monotonic() - received)
 
     def reboot_esp(self, _args):
         if RealRPiGPIOFlag:
             GPIO.output(11, GPIO.LOW)
             time.sleep(1)
             GPIO.output(11, GPIO.HIGH)
+            self.reset_link()
             message = "Cycle Complete"
             self._rhapi.ui.message_notify(self._rhapi.language.__(message))
 
@@ -121,315 +163,589 @@ class elrsBackpack(VRxController):
     def combine_bytes(self, a, b):
         return (b << 8) | a
 
-    def backpack_connector(self):
-        version = msp_message()
-        version.set_function(msptypes.MSP_ELRS_GET_BACKPACK_VERSION)
-        version_message = version.get_msp()
-        
-        logger.info("Attempting to find backpack")
-        
-        ports = list(serial.tools.list_ports.comports())
-        s = serial.Serial(baudrate=460800,
-                        bytesize=8, parity='N', stopbits=1,
-                        timeout=0.01, xonxoff=0, rtscts=0)
-        
-        #
-        # Search for connected backpack
-        #
+    def send_settings(self) -> tuple:
+        options = self._options
+        return options.send_delay, options.batch_limit
+
+    def on_backpack_packet(self, mode, payload):
+        # Monitor SET_RECORDING_STATE for controlling race. Called on a
+        # link's reader thread, the race itself is controlled from the hub.
+        if mode == msptypes.MSP_ELRS_BACKPACK_SET_RECORDING_STATE and payload:
+            received = time.monotonic()
+            command = self.RACE_COMMANDS.get(payload[0])
+            if command is None or not self._options.race_control:
+                return
 
-        for port in ports:
-            s.port = port.device
-            
-            try:
-                s.open()
-            except:
-                logger.warning('Failed to open serial device. Attempting to connect to new device...')
-                continue
-            
-            time.sleep(1.5) # Needed for connecting to DevKitC
+            if not self._race_commands.accept(command, received):
+                self._metrics.record_command_suppressed()
+                return
+            self._dispatcher.submit(self.race_command, command, received)
 
-            try:
-                s.write(version_message)
-            except:
-                logger.error('Failed to write to open serial device. Attempting to connect to new device...')
-                s.close()
+    def backpack_connector(self):
+        # Supervises the backpack links: discovers backpacks, runs each link
+        # in its own thread until it fails, then rediscovers with backoff
+        backoff = self.RECONNECT_BACKOFF_MIN
+        # device -> when it failed a probe; devices that ever answered as a backpack are never listed
+        not_backpack = {}
+        backpack_devices = set()
+        was_connected = False
+
+        while True:
+            self._link_event.clear()
+            if self._link_reset.is_set():
+                self._link_reset.clear()
+                not_backpack.clear()
+
+            active = self._links.devices()
+            multi_link = self._options.multi_link
+
+            #
+            # Search for connected backpacks
+            #
+
+            # Devices that failed a probe are retried once they reappear (hot-plug) or after the longest
+            # backoff, so a backpack that was still booting or briefly stuck is not given up on
+            present = present_devices()
+            now = time.monotonic()
+            for device, failed in list(not_backpack.items()):
+                if device not in present or now - failed >= self.RECONNECT_BACKOFF_MAX:
+                    del not_backpack[device]
+            skip = set(not_backpack)
+
+            if multi_link:
+                # The initial scan as well, so every backpack present at startup connects at once
+                if not active:
+                    logger.info("Attempting to find backpacks")
+                found, probed = connect_more_backpacks(skip=skip | active)
+            elif not active:
+                logger.info("Attempting to find backpack")
+                backpack, probed = connect_backpack(skip=skip)
+                found = [backpack] if backpack else []
+            else:
+                found, probed = [], []
+
+            backpack_devices.update(port.device for _, port, _ in found)
+            for device in set(probed) - backpack_devices:
+                not_backpack.setdefault(device, now)
+
+            for s, port, version in found:
+                logger.info(f"Connected to backpack on {port.device}")
+                logger.info(f"Backpack version: {version}")
+                Thread(target=self.supervise_link, args=(s, was_connected), daemon=True).start()
+
+            if found:
+                backoff = self.RECONNECT_BACKOFF_MIN
+                was_connected = True
+            elif not active:
+                logger.warning(f"Could not find connected backpack. Retrying in {backoff} seconds.")
+                self._link_event.wait(backoff)
+                backoff = min(backoff * 2, self.RECONNECT_BACKOFF_MAX)
                 continue
 
-            response = list(s.read(8))
-            if len(response) == 8:
-                logger.info(f'Device response: {response}')
-                if response[:3] == [ord('$'),ord('X'),ord('>')]:
-                    mode = self.combine_bytes(response[4], response[5])
-                    response_payload_length = self.combine_bytes(response[6], response[7])
-                    response_payload = list(s.read(response_payload_length))
-                    response_check_sum = list(s.read(1))
+            # Wait for a link to drop, looking for additional backpacks now and then
+            self._link_event.wait(self.RESCAN_INTERVAL if multi_link else None)
 
-                    if mode == msptypes.MSP_ELRS_BACKPACK_SET_MODE or mode == msptypes.MSP_ELRS_GET_BACKPACK_VERSION:
-                        logger.info(f"Connected to backpack on {port.device}")
+    def supervise_link(self, s, reconnected):
+        stopped = self.run_link(s, reconnected)
 
-                        version_list = [chr(val) for val in response_payload]
-                        logger.info(f"Backpack version: {''.join(version_list)}")
+        try:
+            s.close()
+        except Exception:
+            pass
 
-                        with self._connector_status_lock:
-                            self._backpack_connected = True
-                        break
-                    
-                    else:
-                        logger.warning(f"Unexpected response from {port.device}, trying next port...")
-                        s.close()
-                        continue
-                else:
-                    logger.warning(f"Unrecongnized response from {port.device}, trying next port...")
-                    s.close()
-                    continue
-            else:
-                logger.warning(f"Bad response from {port.device}, trying next port...")
-                s.close()
-                continue
-        else:
-            logger.warning("Could not find connected backpack. Ending connector thread.")
-            with self._connector_status_lock:
-                self._backpack_connected = False
+        if not stopped:
+            message = 'ELRS Backpack disconnected. Attempting to reconnect...'
+            self._dispatcher.submit(self.show_message, message, True)
+        self._link_event.set()
 
-        #
-        # Backpack connection loop
-        #
+    def run_link(self, s, reconnected=False) -> bool:
+        # Runs a transport on an open serial port until the link fails or is
+        # reset. Returns True if it was stopped by reset_link().
+
+        transport_type = self._options.transport
+        link = backpack_link(getattr(s, 'port', None), priority_send_queue(maxsize=200))
+        link.transport = create_transport(transport_type, s, link.queue,
+                                          self.on_backpack_packet, self.send_settings, self._pacer, self._metrics)
+        logger.info(f"Using {type(link.transport).__name__} for backpack communications")
 
         with self._connector_status_lock:
-            backpack_connected = copy.copy(self._backpack_connected)
-        
-        error_count = 0
-        while backpack_connected:
-
-            self._delay_lock.acquire()
-            delay = copy.copy(self._send_delay)
-            self._delay_lock.release()
-
-            # Handle backpack comms 
-            while not self._backpack_queue.empty():
-                message = self._backpack_queue.get()
-                time.sleep(delay)
-                
-                try:
-                    s.write(message)
-                except:
-                    error_count += 1
-                    if error_count > 5:
-                        logger.error('Failed to write to backpack. Ending connector thread')
-                        s.close()
-                        with self._connector_status_lock:
-                            self._backpack_connected = False
-                        return
-                else:
-                    error_count = 0
-
-            packet = list(s.read(8))
-            if len(packet) == 8:
-                if packet[:3] == [ord('$'),ord('X'),ord('<')]:
-                    mode = self.combine_bytes(packet[4], packet[5])
-                    payload_length = self.combine_bytes(packet[6], packet[7])
-                    payload = list(s.read(payload_length))
-                    check_sum = list(s.read(1))
-
-                    # Monitor SET_RECORDING_STATE for controlling race
-                    if mode == msptypes.MSP_ELRS_BACKPACK_SET_RECORDING_STATE:
-                        if payload[0] == 0x00:
-                            gevent.spawn(self.stop_race)
-                        elif payload[0] == 0x01:
-                            gevent.spawn(self.start_race)
-            
-            with self._connector_status_lock:
-                backpack_connected = copy.copy(self._backpack_connected)
+            self._links.add(link)
+            backlog = list(self._offline_backlog.items())
+            self._offline_backlog.clear()
+
+        # Restore the latest state held while no link was up
+        for key, (frames, priority, pilot_id) in backlog:
+            self.queue_add(frames, priority, key, pilot_id)
+
+        if reconnected:
+            message = 'ELRS Backpack reconnected.'
+            self._dispatcher.submit(self.show_message, message)
 
-            time.sleep(0.01)
+        link.transport.run()
+
+        with self._connector_status_lock:
+            pending = self._links.remove(link)
+
+        # What was still queued moves to the remaining links, or waits for one to come back
+        for item, priority, key in pending:
+            self.queue_add(item, priority, key, getattr(item, 'route', None))
+
+        return link.transport.stopped
+
+    def report_status(self):
+        # Shows the measured send rate and delivery metrics in the settings panels, refreshed while the plugin runs
+        stats = self._pacer.stats()
+        throughput = f"Effective frames/sec: {stats['frames_per_s']:.0f}"
+        if stats['adaptive']:
+            throughput += f" (send delay {stats['delay_us']:.0f} us, repeats {stats['repeat']})"
+
+        updates = []
+        for panel, name, text in (
+            ('elrs_settings', 'bp_throughput', throughput),
+            ('elrs_metrics', 'osd_metrics', format_metrics(self.metrics_snapshot())),
+        ):
+            if text != self._status_text.get(name):
+                self._status_text[name] = text
+                updates.append((panel, name, text))
+
+        # Runs on a scheduler worker, the UI is only updated from the gevent hub
+        if updates:
+            self._dispatcher.submit(self.show_status, updates)
+
+        self._scheduler.schedule(self.THROUGHPUT_INTERVAL, self.report_status, key='status_report')
+
+    def show_status(self, updates:list):
+        for panel, name, text in updates:
+            self._rhapi.ui.register_markdown(panel, name, text)
+        self._rhapi.ui.broadcast_ui('settings')
+
+    def show_message(self, message, alert=False):
+        # For link, supervisor and scheduler threads, which hand it to the hub
+        if alert:
+            self._rhapi.ui.message_alert(self._rhapi.language.__(message))
+        else:
+            self._rhapi.ui.message_notify(self._rhapi.language.__(message))
+
+    def metrics_snapshot(self) -> dict:
+        snapshot = self._metrics.snapshot()
+        snapshot['send_queue'] = self.queue_stats()
+        snapshot['links'] = self._links.stats()
+        snapshot['scheduler'] = self._scheduler.stats()
+        snapshot['pacing'] = self._pacer.stats()
+        snapshot['frame_cache'] = self._frame_cache.stats()
+        snapshot['connected'] = len(self._links) > 0
+        return snapshot
+
+    def queue_stats(self) -> dict:
+        # Send queue counters summed over the links, high-water marks are the highest of any link
+        totals = {}
+        for link in self._links.links():
+            for name, counts in link.queue.stats().items():
+                total = totals.setdefault(name, dict.fromkeys(counts, 0))
+                for field, value in counts.items():
+                    total[field] = max(total[field], value) if field == 'high_water' else total[field] + value
+        return totals
+
+    def dump_metrics(self, _args=None):
+        snapshot = self.metrics_snapshot()
+        snapshot['time'] = time.time()
+        try:
+            with open(self.METRICS_FILE, 'w') as metrics_file:
+                json.dump(snapshot, metrics_file, indent=2)
+        except OSError:
+            logger.warning(f'Unable to write OSD metrics to {self.METRICS_FILE}')
+            return
+        message = f"OSD metrics written to {self.METRICS_FILE}"
+        self._rhapi.ui.message_notify(self._rhapi.language.__(message))
+
+    def reset_metrics(self, _args=None):
+        self._metrics.reset()
+        message = "OSD metrics reset"
+        self._rhapi.ui.message_notify(self._rhapi.language.__(message))
+
+    def reset_link(self):
+        # Drops every link so the supervisor rediscovers the backpacks
+        self._link_reset.set()
+        for link in self._links.links():
+            link.transport.stop()
+        self._link_event.set()
 
     #
     # Backpack message generation
     #
 
     def hash_phrase(self, bindphrase:str) -> list:
-        bindingPhraseHash = [x for x in hashlib.md5(("-DMY_BINDING_PHRASE=\"" + bindphrase + "\"").encode()).digest()[0:6]]
-        if (bindingPhraseHash[0] % 2) == 1:
-            bindingPhraseHash[0] -= 0x01
-        return bindingPhraseHash
+        return list(phrase_uid(bindphrase))
     
     def centerOSD(self, stringlength, hardwaretype):
         # return 0 if row size is not defined or hardwaretype is not defined in HARDWARE_SETTINGS
-        if hardwaretype not in HARDWARE_SETTINGS:
+        if hardwaretype is None or hardwaretype.value not in HARDWARE_SETTINGS:
             return 0
         
-        if 'row_size' not in HARDWARE_SETTINGS[hardwaretype]:
+        if 'row_size' not in HARDWARE_SETTINGS[hardwaretype.value]:
             return 0
 
         offset = int(stringlength/2)
         if hardwaretype:
-            col = int(HARDWARE_SETTINGS[hardwaretype]['row_size'] / 2) - offset
+            col = int(HARDWARE_SETTINGS[hardwaretype.value]['row_size'] / 2) - offset
             if col < 0:
                 col = 0
         else:
             col = 0
         return col
 
-    def queue_add(self, msp):
+    def queue_add(self, frames:tuple, priority=sendPriority.CONTROL, key=None, pilot_id=None, stale=None):
+        # Pilot traffic goes to the pilot's link, everything else to every link
         with self._connector_status_lock:
-            if self._backpack_connected is False:
+            links = self._links.route(pilot_id)
+            if not links:
+                # Hold the latest state per pilot row until the link is back
+                if key is not None:
+                    self._offline_backlog[key] = (frames, priority, pilot_id)
+                    self._offline_backlog.move_to_end(key)
+                    self._metrics.record_offline()
+                    if len(self._offline_backlog) > self.OFFLINE_BACKLOG_SIZE:
+                        self._offline_backlog.popitem(last=False)
+                        self._metrics.record_drop()
+                else:
+                    self._metrics.record_drop()
                 return
-        try:
-            self._backpack_queue.put(msp, block=False)
-        except queue.Full:
+
+            if isinstance(frames, tracked_frames):
+                # Remembered so a lost link's queue can be handed to the others
+                frames.route = pilot_id
+
+            # Queued under the lock, a link being removed has either drained the item or never sees it
+            full = False
+            for link in links:
+                if stale:
+                    link.queue.supersede(priority, *stale)
+                try:
+                    link.queue.put(frames, priority, key)
+                except queue.Full:
+                    self._metrics.record_drop()
+                    full = True
+                else:
+                    link.transport.notify()
+
+        if full:
             if self._queue_full is False:
                 self._queue_full = True
-                message = 'ERROR: ELRS Backpack not responding. Please reboot the server to attempt to reconnect.'
-                self._rhapi.ui.message_alert(self._rhapi.language.__(message))
+                message = 'ERROR: ELRS Backpack not responding. OSD updates are being dropped.'
+                self._dispatcher.submit(self.show_message, message, True)
         else:
             if self._queue_full is True:
                 self._queue_full = False
                 message = 'ELRS Backpack has start responding again.'
-                self._rhapi.ui.message_notify(self._rhapi.language.__(message))
+                self._dispatcher.submit(self.show_message, message)
     
-    def send_msp(self, msp):
-        self.queue_add(msp)
+    def send_msp(self, msp, txn:osd_transaction=None):
+        copies = 1
         if self.combine_bytes(msp[4], msp[5]) == msptypes.MSP_ELRS_SET_OSD:
-            for _ in range(self._repeat_count):
-                self.queue_add(msp)
-            
-    def set_sendUID(self, bindingHash:list):
-        message = msp_message()
-        message.set_function(msptypes.MSP_ELRS_SET_SEND_UID)
-        message.set_payload([1] + bindingHash)
-        self.send_msp(message.get_msp())
-        self._activePilotIdentifier = '.'.join(map(str, bindingHash))
+            copies += self._pacer.repeat
+
+        if txn is None:
+            self.queue_add((msp,) * copies)
+        else:
+            for _ in range(copies):
+                txn.add(msp)
+
+    def get_frame(self, function:int, payload) -> bytes:
+        return self._frame_cache.get(function, payload)
+
+    def begin_transaction(self, target:pilot_target, priority=sendPriority.STATUS, key=None, event_time=None) -> osd_transaction:
+        txn = osd_transaction(target.uid_frame, target.identifier, target.pilot_id, priority, key)
+        txn.target = target
+        txn.event_time = event_time
+        return txn
+
+    def submit_transaction(self, txn:osd_transaction):
+        self.submit_segments(txn, txn.take())
+
+    def submit_segments(self, txn:osd_transaction, segments:list):
+        self.cancel_sequence(txn)
+        self.play_segments(txn, segments, 0)
+
+    def cancel_sequence(self, txn:osd_transaction):
+        if txn.target and txn.target.is_craftname:
+            # The craftname is a single line, a new message ends any running animation
+            self._scheduler.cancel(('sequence', txn.pilot_id))
+
+    def play_segments(self, txn:osd_transaction, segments:list, index:int):
+        # Held segments are sent from the scheduler's timer, so an animation
+        # never blocks a worker and steps of different pilots interleave
+        frames, delay = segments[index]
+        if frames:
+            if txn.uid_frame:
+                frames = (txn.uid_frame,) + frames + (self._CLEAR_UID_FRAME,)
+            # Later steps of an animation are timed from their own start
+            event_time = txn.event_time if index == 0 else None
+            kind = txn.key[0] if txn.key else None
+            stale = self.stale_selectors([txn]) if index == 0 else None
+            self.queue_add(self._metrics.tag(frames, kind, txn.pilot_id, event_time), txn.priority, txn.key,
+                           txn.pilot_id, stale)
+
+        if index + 1 < len(segments):
+            self._scheduler.schedule(delay, self.play_segments, txn, segments, index + 1,
+                                     key=('sequence', txn.pilot_id))
+
+    def broadcast(self, targets:list, build, priority, key, event_time=None):
+        '''
+        Sends content that is the same for every pilot. build(txn, target)
+        fills each pilot's transaction; pilots of the same hardware type then
+        share one queue item per backpack link with a single trailing
+        clear_sendUID.
+        '''
+        groups = {}
+        for target in targets:
+            txn = self.begin_transaction(target, priority, (key, target.pilot_id), event_time)
+            build(txn, target)
+            segments = txn.take()
+
+            # Animated craftname messages keep their own per-pilot timing
+            if len(segments) > 1:
+                self.submit_segments(txn, segments)
+                continue
+
+            self.cancel_sequence(txn)
+            links = self._links.route(target.pilot_id)
+            link = id(links[0]) if len(links) == 1 else None
+            groups.setdefault((link, target.hardware), []).append((txn, segments[0][0]))
+
+        for (link, hardware), members in groups.items():
+            frames = merge_transactions(members, self._CLEAR_UID_FRAME)
+            if frames:
+                # Routed like its first pilot, the rest of the group shares that link
+                pilot_id = members[0][0].pilot_id if link is not None else None
+                item = self._metrics.tag(frames, key, None, event_time)
+                item.members = tuple(txn.pilot_id for txn, items in members if items)
+                self.queue_add(item, priority, ('broadcast', key, hardware), pilot_id,
+                               self.stale_selectors([txn for txn, _ in members]))
+
+    def reset_positions(self):
+        # The position rows were cleared, the next lap redraws them. Called with _queue_lock held.
+        for pilot_id in self._positions_shown:
+            self._scheduler.cancel(('position', pilot_id))
+        self._positions_shown = {}
+
+    def stale_selectors(self, txns:list):
+        '''
+        For transactions that clear rows or the screen: selectors for the
+        queued, less urgent items they make stale, so a clear is never
+        overtaken by older text. Items for one pilot are dropped, merged
+        items that include the pilot are sent ahead of the clear.
+        '''
+        cleared = {txn.pilot_id: (txn.cleared_all, txn.cleared_rows) for txn in txns
+                   if txn.pilot_id is not None and (txn.cleared_all or txn.cleared_rows)}
+        if not cleared:
+            return None
+
+        options = self._options
+        rows = {
+            'status'        : options.status_row,
+            'announcement'  : options.announcement_row,
+            'currentlap'    : options.currentlap_row,
+            'lapresults'    : options.lapresults_row,
+        }
+
+        def covers(pilot_id, kind) -> bool:
+            if pilot_id not in cleared:
+                return False
+            cleared_all, cleared_rows = cleared[pilot_id]
+            return cleared_all or rows.get(kind) in cleared_rows
+
+        def drop(item) -> bool:
+            return isinstance(item, tracked_frames) and covers(item.pilot_id, item.kind)
+
+        def promote(item) -> bool:
+            return isinstance(item, tracked_frames) and any(covers(pilot_id, item.kind) for pilot_id in item.members)
+
+        return drop, promote
+
+    def schedule_clear(self, delay, clear, target:pilot_target, row):
+        key = ('clear', target.pilot_id, row)
+        token = object()
+        with self._clear_lock:
+            self._clear_tokens[key[1:]] = token
+            self._scheduler.schedule(delay, self.run_clear, key, token, clear, target, key=key)
+
+    def run_clear(self, key, token, clear, target:pilot_target):
+        # The token is checked as the clear runs, not when its timer fires, so a write
+        # that cancels it after that is never followed by the stale clear
+        with self._clear_lock:
+            if self._clear_tokens.get(key[1:]) is not token:
+                return
+            del self._clear_tokens[key[1:]]
+            clear(target)
+
+    def clear_pending(self, target:pilot_target, row) -> bool:
+        with self._clear_lock:
+            return (target.pilot_id, row) in self._clear_tokens
+
+    def cancel_clear(self, txn:osd_transaction, row):
+        # A new write to the row supersedes its pending clear
+        if txn.pilot_id is not None:
+            with self._clear_lock:
+                self._clear_tokens.pop((txn.pilot_id, row), None)
+                self._scheduler.cancel(('clear', txn.pilot_id, row))
+
+    def cancel_clears(self, txn:osd_transaction):
+        for row in (self._options.status_row, self._options.announcement_row, self._options.currentlap_row, self._options.lapresults_row):
+            self.cancel_clear(txn, row)
 
     def clear_sendUID(self):
-        message = msp_message()
-        message.set_function(msptypes.MSP_ELRS_SET_SEND_UID)
-        message.set_payload([0])
-        self.send_msp(message.get_msp())
+        self.send_msp(self._CLEAR_UID_FRAME)
 
-        self._activePilotIdentifier = None
+    #
+    # OSD framebuffers
+    #
 
-    def send_clear(self, hardwaretype, displayLastPersistentMessage = True):
-        if hardwaretype == 'betaflight_craftname':
-            persistentMessageToRecover = self._last_persistent_betaflight_craftname_message.get(self._activePilotIdentifier)
+    def framebuffer(self, txn:osd_transaction, hardwaretype) -> osd_framebuffer:
+        if not self._options.diff_updates or txn.identifier is None:
+            return None
+
+        target = txn.target
+        if target is None or not target.rows or not target.cols:
+            return None
+
+        framebuffer = self._framebuffers.get(txn.identifier)
+        if framebuffer is None:
+            framebuffer = self._framebuffers.setdefault(txn.identifier,
+                osd_framebuffer(target.rows, target.cols))
+        txn.framebuffer = framebuffer
+        return framebuffer
+
+    def osd_frames(self, frame:bytes) -> list:
+        return [frame] * (1 + self._pacer.repeat)
+
+    def framebuffer_op(self, operation, *args) -> list:
+        operation(*args)
+        return []
+
+    def clear_framebuffer(self, framebuffer:osd_framebuffer) -> list:
+        framebuffer.clear()
+        return self.osd_frames(self._CLEAR_FRAME)
+
+    def flush_framebuffer(self, framebuffer:osd_framebuffer) -> list:
+        # Only the spans that changed since the last display are written
+        cleared = framebuffer.cleared
+        frames = []
+        for row, col, data in framebuffer.flush():
+            frames += self.osd_frames(self.get_frame(msptypes.MSP_ELRS_SET_OSD, bytes([0x03,row,col,0]) + data))
+        if frames or cleared:
+            frames += self.osd_frames(self._DISPLAY_FRAME)
+        return frames
+
+    def send_clear(self, txn:osd_transaction, hardwaretype, displayLastPersistentMessage = True):
+        if hardwaretype is hardwareOptions.BETAFLIGHT_CRAFTNAME:
+            # The craftname is a single line, anything queued for it before is replaced
+            txn.cleared_all = True
+            persistentMessageToRecover = txn.target.last_message if txn.target else None
             if displayLastPersistentMessage and persistentMessageToRecover:
-                self.send_msg(0, 0, persistentMessageToRecover, hardwaretype, False)
+                self.send_msg(txn, 0, 0, persistentMessageToRecover, hardwaretype, False)
                 return
 
-            self.send_msg(0, 0, '    ', hardwaretype, False)
+            self.send_msg(txn, 0, 0, '    ', hardwaretype, False)
             return
 
-        message = msp_message()
-        message.set_function(msptypes.MSP_ELRS_SET_OSD)
-        message.set_payload([0x02])
-        self.send_msp(message.get_msp())
+        txn.cleared_all = True
+        self.cancel_clears(txn)
+        framebuffer = self.framebuffer(txn, hardwaretype)
+        if framebuffer:
+            txn.add_op(partial(self.clear_framebuffer, framebuffer))
+        else:
+            self.send_msp(self._CLEAR_FRAME, txn)
 
-    def send_announcement(self, str, hardwareType, persistent = False):
-        if hardwareType != 'betaflight_craftname':
-            self.send_clear_announcement(hardwareType)
+    def send_announcement(self, txn:osd_transaction, str, hardwareType, persistent = False):
+        self.cancel_clear(txn, self._options.announcement_row)
+        if hardwareType is not hardwareOptions.BETAFLIGHT_CRAFTNAME:
+            self.send_clear_announcement(txn, hardwareType)
 
         col = self.centerOSD(len(str), hardwareType)
-        self.send_msg(self._announcement_row, col, str, hardwareType, persistent)
+        self.send_msg(txn, self._options.announcement_row, col, str, hardwareType, persistent)
 
-    def send_status(self, str, hardwareType, clearFullScreen = False, persistent = False):
-        if hardwareType != 'betaflight_craftname':
+    def send_status(self, txn:osd_transaction, str, hardwareType, clearFullScreen = False, persistent = False):
+        self.cancel_clear(txn, self._options.status_row)
+        if hardwareType is not hardwareOptions.BETAFLIGHT_CRAFTNAME:
             if clearFullScreen:
-                self.send_clear(hardwareType)
+                self.send_clear(txn, hardwareType)
             else:
-                self.send_clear_status(hardwareType)
+                self.send_clear_status(txn, hardwareType)
 
         col = self.centerOSD(len(str), hardwareType)
-        self.send_msg(self._status_row, col, str, hardwareType, persistent)
+        self.send_msg(txn, self._options.status_row, col, str, hardwareType, persistent)
 
-    def send_currentlap(self, str, hardwareType, persistent = False):
-        if hardwareType != 'betaflight_craftname':
-            self.send_clear_currentlap(hardwareType)
+    def send_currentlap(self, txn:osd_transaction, str, hardwareType, persistent = False):
+        self.cancel_clear(txn, self._options.currentlap_row)
+        if hardwareType is not hardwareOptions.BETAFLIGHT_CRAFTNAME:
+            self.send_clear_currentlap(txn, hardwareType)
 
         col = self.centerOSD(len(str), hardwareType)
-        self.send_msg(self._currentlap_row, col, str, hardwareType, persistent)
+        self.send_msg(txn, self._options.currentlap_row, col, str, hardwareType, persistent)
 
-    def send_lapresults(self, str, hardwareType, persistent = False):
-        if hardwareType != 'betaflight_craftname':
-            self.send_clear_lapresults(hardwareType)
+    def send_lapresults(self, txn:osd_transaction, str, hardwareType, persistent = False):
+        self.cancel_clear(txn, self._options.lapresults_row)
+        if hardwareType is not hardwareOptions.BETAFLIGHT_CRAFTNAME:
+            self.send_clear_lapresults(txn, hardwareType)
 
         col = self.centerOSD(len(str), hardwareType)
-        self.send_msg(self._lapresults_row, col, str, hardwareType, persistent)
-
-    def send_msg(self, row, col, str, hardwaretype, persistent):
-        payload = [1]
-        if hardwaretype != 'betaflight_craftname':
-            payload = [0x03,row,col,0]
-            str = str.replace('>>', 'x')
-            str = str.replace('<<', 'w')
-        elif len(str) > 16:
-            str = str.replace('>>', '')
-            str = str.replace('<<', '')
-
-        str = str.strip()
-
-        if hardwaretype == 'betaflight_craftname' and len(str) < 16:
-            # if the string is shorter than 16 characters, center it by prepending spaces
-            spacesToAdd = int((16 - len(str)) / 2)
-            str = (' ' * spacesToAdd) + str
-
-        # add every character using the ord() function to payload
-        # if hardwareType == betaflight_craftname, then only upto 16 characters can be sent
-        for index, char in enumerate(str):
-            if hardwaretype == 'betaflight_craftname' and index > 15:
-                logger.info("too many characters for betaflight_craftname, breaking into next line")
-                break
-            payload.append(ord(char))
+        self.send_msg(txn, self._options.lapresults_row, col, str, hardwareType, persistent)
 
-        message = msp_message()
+    def send_msg(self, txn:osd_transaction, row, col, str, hardwaretype, persistent):
+        if hardwaretype is hardwareOptions.BETAFLIGHT_CRAFTNAME:
+            # if the string is longer than 16 characters, make it scroll
+            for index, frame in enumerate(craftname_frames(str)):
+                if index:
+                    txn.hold(SCROLL_INTERVAL)
+                self.send_msp(frame, txn)
 
-        if hardwaretype == 'betaflight_craftname':
-            message.set_function(msptypes.MSP_ELRS_SET_NAME)
-        else:
-            message.set_function(msptypes.MSP_ELRS_SET_OSD)
+            if persistent and txn.target:
+                txn.target.last_message = str
+            return
 
-        message.set_payload(payload)
-        mspString = message.get_msp()
-        self.send_msp(mspString)
+        # Lines built from templates carry their glyphs, other text is encoded through a cache
+        glyphs = str.glyphs if isinstance(str, osd_line) else osd_glyphs(str)
 
-        if hardwaretype == 'betaflight_craftname' and len(str) > 16:
-            # if the string is longer than 16 characters, make it scroll
-            time.sleep(0.4)
-            self.send_msg(row, col, str[1:], hardwaretype, False)
+        framebuffer = self.framebuffer(txn, hardwaretype)
+        if framebuffer:
+            txn.add_op(partial(self.framebuffer_op, framebuffer.write, row, col, glyphs))
+        else:
+            self.send_msp(self.get_frame(msptypes.MSP_ELRS_SET_OSD, bytes((0x03, row, col, 0)) + glyphs), txn)
 
-        if persistent:
-            self._last_persistent_betaflight_craftname_message[self._activePilotIdentifier] = str
+        if persistent and txn.target:
+            txn.target.last_message = str
 
-    def send_display(self):
-        message = msp_message()
-        message.set_function(msptypes.MSP_ELRS_SET_OSD)
-        message.set_payload([0x04])
-        self.send_msp(message.get_msp())
+    def send_display(self, txn:osd_transaction):
+        if txn.framebuffer:
+            txn.add_op(partial(self.flush_framebuffer, txn.framebuffer))
+        else:
+            self.send_msp(self._DISPLAY_FRAME, txn)
     
-    def send_clear_status(self, hardwareType, displayLastPersistentMessage = True):
-        self.send_clear_row(self._status_row, hardwareType, displayLastPersistentMessage)
+    def send_clear_status(self, txn:osd_transaction, hardwareType, displayLastPersistentMessage = True):
+        self.send_clear_row(txn, self._options.status_row, hardwareType, displayLastPersistentMessage)
 
-    def send_clear_announcement(self, hardwareType, displayLastPersistentMessage = True):
-        self.send_clear_row(self._announcement_row, hardwareType, displayLastPersistentMessage)
+    def send_clear_announcement(self, txn:osd_transaction, hardwareType, displayLastPersistentMessage = True):
+        self.send_clear_row(txn, self._options.announcement_row, hardwareType, displayLastPersistentMessage)
 
-    def send_clear_currentlap(self, hardwareType, displayLastPersistentMessage = True):
-        self.send_clear_row(self._currentlap_row, hardwareType, displayLastPersistentMessage)
+    def send_clear_currentlap(self, txn:osd_transaction, hardwareType, displayLastPersistentMessage = True):
+        self.send_clear_row(txn, self._options.currentlap_row, hardwareType, displayLastPersistentMessage)
 
-    def send_clear_lapresults(self, hardwareType, displayLastPersistentMessage = True):
-        self.send_clear_row(self._lapresults_row, hardwareType, displayLastPersistentMessage)
+    def send_clear_lapresults(self, txn:osd_transaction, hardwareType, displayLastPersistentMessage = True):
+        self.send_clear_row(txn, self._options.lapresults_row, hardwareType, displayLastPersistentMessage)
 
-    def send_clear_row(self, row, hardwaretype, displayLastPersistentMessage = True):
-        if hardwaretype == 'betaflight_craftname':
-            self.send_clear(hardwaretype, displayLastPersistentMessage)
+    def send_clear_row(self, txn:osd_transaction, row, hardwaretype, displayLastPersistentMessage = True):
+        if hardwaretype is hardwareOptions.BETAFLIGHT_CRAFTNAME:
+            self.send_clear(txn, hardwaretype, displayLastPersistentMessage)
             return
         
-        payload = [0x03,row,0,0]
-        for x in range(HARDWARE_SETTINGS[hardwaretype]['row_size']):
-            payload.append(0)
-
-        message = msp_message()
-        message.set_function(msptypes.MSP_ELRS_SET_OSD)
-        message.set_payload(payload)
+        txn.cleared_rows.add(row)
+        framebuffer = self.framebuffer(txn, hardwaretype)
+        if framebuffer:
+            txn.add_op(partial(self.framebuffer_op, framebuffer.clear_row, row))
+            return
 
-        self.send_msp(message.get_msp())
+        payload = bytes([0x03,row,0,0]) + bytes(HARDWARE_SETTINGS[hardwaretype.value]['row_size'])
+        self.send_msp(self.get_frame(msptypes.MSP_ELRS_SET_OSD, payload), txn)
 
     def activate_bind(self, _args):
         message = "Activating backpack's bind mode..."
@@ -457,39 +773,36 @@ class elrsBackpack(VRxController):
 
         def test():
             message = 'ROTORHAZARD'
-            self._queue_lock.acquire()
-            #self.send_clear('betaflight_craftname')
-            self.send_msg(0, 0, message, 'betaflight_craftname', False)
-            #self.send_display()
-            self._queue_lock.release()
+            txn = osd_transaction()
+            #self.send_clear(txn, hardwareOptions.BETAFLIGHT_CRAFTNAME)
+            self.send_msg(txn, 0, 0, message, hardwareOptions.BETAFLIGHT_CRAFTNAME, False)
+            #self.send_display(txn)
+            self.submit_transaction(txn)
 
             time.sleep(1)
 
-            self._queue_lock.acquire()
-            self.send_clear('betaflight_craftname')
-            #self.send_display()
-            self._queue_lock.release()
+            self.send_clear(txn, hardwareOptions.BETAFLIGHT_CRAFTNAME)
+            #self.send_display(txn)
+            self.submit_transaction(txn)
         #    for row in range(HARDWARE_SETTINGS['hdzero']['column_size']):
 
-#                self._queue_lock.acquire()
-#                self.send_clear('hdzero')
+#                txn = osd_transaction()
+#                self.send_clear(txn, 'hdzero')
 #                start_col = self.centerOSD(len(message), 'hdzero')
-#                self.send_msg(row, start_col, message, 'hdzero')    
-#                self.send_display()
-#                self._queue_lock.release()
+#                self.send_msg(txn, row, start_col, message, 'hdzero')    
+#                self.send_display(txn)
+#                self.submit_transaction(txn)
 
 #                time.sleep(0.5)
 
-#                self._queue_lock.acquire()
-#                self.send_clear_row(row, 'hdzero')
-#                self.send_display()
-#                self._queue_lock.release()
+#                self.send_clear_row(txn, row, 'hdzero')
+#                self.send_display(txn)
+#                self.submit_transaction(txn)
 
 #            time.sleep(1)
-#            self._queue_lock.acquire()
-#            self.send_clear('hdzero')
-#            self.send_display()
-#            self._queue_lock.release()
+#            self.send_clear(txn, 'hdzero')
+#            self.send_display(txn)
+#            self.submit_transaction(txn)
 
         Thread(target=test, daemon=True).start()
 
@@ -497,72 +810,78 @@ class elrsBackpack(VRxController):
     # VRxC Event Triggers
     #
 
-    def onPilotAlter(self, args):
-        pilot_id = args['pilot_id']
-        self._queue_lock.acquire()
-
-        if pilot_id in self._heat_data:
-            pilot_settings = {}
-
-            hardware_type = self._rhapi.db.pilot_attribute_value(pilot_id, 'hardware_type')
-            logger.info(f"Pilot {pilot_id}'s hardware set to {hardware_type}")
-            if hardware_type in HARDWARE_SETTINGS:
-                pilot_settings['hardware_type'] = hardware_type
-            else:
-                self._heat_data[pilot_id] = None
-                self._queue_lock.release()
-                return
-
-            bindphrase = self._rhapi.db.pilot_attribute_value(pilot_id, 'comm_elrs')
+    def resolve_target(self, pilot_id) -> pilot_target:
+        # Resolved pilots are cached until PILOT_ALTER or onPilotsReplaced() invalidates them
+        try:
+            return self._pilot_cache[pilot_id]
+        except KeyError:
+            pass
+
+        # One query for all of the pilot's attributes instead of one per attribute
+        attributes = {attribute.name: attribute.value for attribute in self._rhapi.db.pilot_attributes(pilot_id)}
+
+        hardware_type = attributes.get('hardware_type')
+        logger.info(f"Pilot {pilot_id}'s hardware set to {hardware_type}")
+        hardware = resolve_hardware(hardware_type)
+        if hardware is None:
+            target = None
+        else:
+            bindphrase = attributes.get('comm_elrs')
             if bindphrase:
-                UID = self.hash_phrase(bindphrase)
-                pilot_settings['UID'] = UID
+                UID = phrase_uid(bindphrase)
             else:
-                UID = self.hash_phrase(self._rhapi.db.pilot_by_id(pilot_id).callsign)
-                pilot_settings['UID'] = UID
+                UID = phrase_uid(self._rhapi.db.pilot_by_id(pilot_id).callsign)
 
-            self._heat_data[pilot_id] = pilot_settings
-            logger.info(f"Pilot {pilot_id}'s UID set to {UID}")
+            logger.info(f"Pilot {pilot_id}'s UID set to {list(UID)}")
+            target = pilot_target(pilot_id, hardware, UID)
 
-        self._queue_lock.release()
+        self._pilot_cache[pilot_id] = target
+        return target
 
-    def onHeatSet(self, args):
+    def onPilotAlter(self, args):
+        pilot_id = args['pilot_id']
+        self._pilot_cache.pop(pilot_id, None)
 
-        heat_data = {}
+        with self._queue_lock:
+            if pilot_id in self._targets:
+                targets = dict(self._targets)
+                targets[pilot_id] = self.resolve_target(pilot_id)
+                self._targets = carry_over(targets, self._targets)
+
+    def onPilotsReplaced(self, _args=None):
+        # Pilot ids are reused after a database reset, restore, recovery or import, and a deleted
+        # pilot's id may be handed out again, so nothing resolved before can be trusted
+        with self._queue_lock:
+            self._pilot_cache = {}
+            self._targets = {}
+            self._targets_heat = None
+
+    def onHeatSet(self, args):
+        # Resolves every pilot of the heat up front, so race events never touch the database
+        targets = {}
         for slot in self._rhapi.db.slots_by_heat(args['heat_id']):
             if slot.pilot_id:
-                hardware_type = self._rhapi.db.pilot_attribute_value(slot.pilot_id, 'hardware_type')
-                if hardware_type not in HARDWARE_SETTINGS:
-                    heat_data[slot.pilot_id] = None
-                    continue
-
-                pilot_settings = {}
-                pilot_settings['hardware_type'] = hardware_type
-                logger.info(f"Pilot {slot.pilot_id}'s hardware set to {self._rhapi.db.pilot_attribute_value(slot.pilot_id, 'hardware_type')}")
-
-                bindphrase = self._rhapi.db.pilot_attribute_value(slot.pilot_id, 'comm_elrs')
-                if bindphrase:
-                    UID = self.hash_phrase(bindphrase)
-                    pilot_settings['UID'] = UID
-                else:
-                    UID = self.hash_phrase(self._rhapi.db.pilot_by_id(slot.pilot_id).callsign)
-                    pilot_settings['UID'] = UID
-                
-                heat_data[slot.pilot_id] = pilot_settings
-                logger.info(f"Pilot {slot.pilot_id}'s UID set to {UID}")
-        
-        self._heat_data = heat_data
+                targets[slot.pilot_id] = self.resolve_target(slot.pilot_id)
+
+        # Readers hold on to whichever registry they picked up, so it is swapped, never modified
+        with self._queue_lock:
+            self._targets = carry_over(targets, self._targets)
+            self._targets_heat = args['heat_id']
+
+        # With several backpacks the heat is spread over them before its first message
+        self._links.assign(pilot_id for pilot_id, target in targets.items() if target)
 
     def onRaceStage(self, args):
-        # Set OSD options
-        self.setOptions()
+        event_time = time.monotonic()
 
-        # Setup heat if not done already
         with self._queue_lock:
             self.clear_sendUID()
             self._finished_pilots = []
-            if not self._heat_data:
-                self.onHeatSet(args)
+            self.reset_positions()
+
+        # Setup heat if not done already, normally HEAT_SET has resolved it
+        if self._targets_heat != args['heat_id']:
+            self.onHeatSet(args)
 
         heat_data = self._rhapi.db.heat_by_id(args['heat_id'])
         raceclass = None
@@ -579,7 +898,7 @@ class elrsBackpack(VRxController):
             heat_name = heat_data.name
 
 
-        if heat_data and self._heat_name and class_name and heat_name:
+        if heat_data and self._options.heat_name and class_name and heat_name:
             round_trans = self._rhapi.__('Round')
             round_num = self._rhapi.db.heat_max_round(args['heat_id']) + 1
             if round_num > 1:
@@ -588,284 +907,241 @@ class elrsBackpack(VRxController):
                 race_name = f'x {class_name.upper()} | {heat_name.upper()} w'
 
         # Send stage message to all pilots
-        def arm(pilot_id):
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_status(self._racestage_message, hardwareType, True)
-            if self._heat_name and class_name and heat_name:
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_announcement(race_name, hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
-
-        with self._queue_lock:
-            for pilot_id in self._heat_data:
-                if self._heat_data[pilot_id]:
-                    Thread(target=arm, args=(pilot_id,), daemon=True).start()
+        def arm(txn:osd_transaction, target:pilot_target):
+            hardwareType = target.hardware
+            self.send_status(txn, self._options.racestage_message, hardwareType, True)
+            if self._options.heat_name and class_name and heat_name:
+                if target.is_craftname:
+                    txn.hold(1)
+                self.send_announcement(txn, race_name, hardwareType)
+            self.send_display(txn)
+
+        targets = [target for target in self._targets.values() if target]
+        self._scheduler.submit(self.broadcast, targets, arm, sendPriority.STATUS, 'status', event_time)
 
     def onRaceStart(self, _args):
         
-        def start(pilot_id):
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_status(self._racestage_message, hardwareType, True)
-            self.send_display()
-            self.clear_sendUID()
-            delay = copy.copy(self._racestart_uptime)
-            self._queue_lock.release()
+        def start(txn:osd_transaction, target:pilot_target):
+            self.send_status(txn, self._options.racestage_message, target.hardware, True)
+            self.send_display(txn)
 
-            time.sleep(delay)
+            self.schedule_clear(txn.held + self._options.racestart_uptime, clear, target, self._options.status_row)
 
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_clear_status(hardwareType, False)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def clear(target:pilot_target):
+            txn = self.begin_transaction(target, sendPriority.STATUS, ('status', target.pilot_id))
+            self.send_clear_status(txn, target.hardware, False)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
-        with self._queue_lock:
-            for pilot_id in self._heat_data:
-                if self._heat_data[pilot_id]:
-                    thread1 = Thread(target=start, args=(pilot_id,), daemon=True)
-                    thread1.start()
+        targets = [target for target in self._targets.values() if target]
+        self._scheduler.submit(self.broadcast, targets, start, sendPriority.STATUS, 'status', time.monotonic())
 
     def onRaceFinish(self, _args):
         
-        def start(pilot_id):
-
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_status(self._racefinish_message, hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            delay = copy.copy(self._finish_uptime)
-            self._queue_lock.release()
+        def start(txn:osd_transaction, target:pilot_target):
+            self.send_status(txn, self._options.racefinish_message, target.hardware)
+            self.send_display(txn)
 
-            time.sleep(delay)
+            self.schedule_clear(txn.held + self._options.finish_uptime, clear, target, self._options.status_row)
 
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_clear_status(hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def clear(target:pilot_target):
+            txn = self.begin_transaction(target, sendPriority.STATUS, ('status', target.pilot_id))
+            self.send_clear_status(txn, target.hardware)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
         with self._queue_lock:
-            for pilot_id in self._heat_data:
-                if self._heat_data[pilot_id] and (pilot_id not in self._finished_pilots):
-                    Thread(target=start, args=(pilot_id,), daemon=True).start()
+            targets = [target for pilot_id, target in self._targets.items()
+                       if target and (pilot_id not in self._finished_pilots)]
+        self._scheduler.submit(self.broadcast, targets, start, sendPriority.STATUS, 'status', time.monotonic())
 
     def onRaceStop(self, _args):
-        def land(pilot_id):
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_status(self._racestop_message, hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def land(txn:osd_transaction, target:pilot_target):
+            self.send_status(txn, self._options.racestop_message, target.hardware)
+            self.send_display(txn)
 
         with self._queue_lock:
-            for pilot_id in self._heat_data:
-                if self._heat_data[pilot_id] and (pilot_id not in self._finished_pilots):
-                    Thread(target=land, args=(pilot_id,), daemon=True).start()
+            targets = [target for pilot_id, target in self._targets.items()
+                       if target and (pilot_id not in self._finished_pilots)]
+        self._scheduler.submit(self.broadcast, targets, land, sendPriority.STATUS, 'status', time.monotonic())
+
+        cache_stats = self._frame_cache.stats()
+        logger.info(f"Frame cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, {cache_stats['size']}/{cache_stats['maxsize']} frames")
+        for name, counts in self.queue_stats().items():
+            if counts['dropped'] or counts['superseded']:
+                logger.info(f"Send queue {name}: {counts['dropped']} dropped, {counts['superseded']} superseded")
+        scheduler_stats = self._scheduler.stats()
+        logger.info(f"OSD scheduler: {scheduler_stats['queue_depth']} queued, {scheduler_stats['timers_pending']} timers, lag avg {scheduler_stats['lag_avg_ms']:.1f} ms, max {scheduler_stats['lag_max_ms']:.1f} ms")
 
     def onRaceLapRecorded(self, args):
+        event_time = time.monotonic()
+        targets = self._targets
+
+        def position_message(result) -> str:
+            if not self._options.position_mode or len(targets) == 1:
+                return self._LAP_TEMPLATE.fill(result['laps'] + 1)
+            return self._POSITION_TEMPLATE.fill(str(result['position']).upper(), result['laps'] + 1)
+
+        def update_pos(target:pilot_target, message):
+            if target.is_craftname and self.clear_pending(target, self._options.lapresults_row):
+                # The single craftname line shows a lap result, its clear brings back the newest position
+                target.last_message = message
+                return
 
-        def update_pos(result):
-            pilot_id = result['pilot_id']
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
-
-            self._queue_lock.acquire()
-            if not self._position_mode or len(self._heat_data) == 1:
-                message = f"LAP: {result['laps'] + 1}"
-            else:
-                message = f"POSN: {str(result['position']).upper()} | LAP: {result['laps'] + 1}"
-
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_currentlap(message, hardwareType, True)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
-
-        def lap_results(result, gap_info):
-            pilot_id = result['pilot_id']
-
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
+            txn = self.begin_transaction(target, sendPriority.LAP, ('currentlap', target.pilot_id), event_time)
+            self.send_currentlap(txn, message, target.hardware, True)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
-            self._queue_lock.acquire()
-            if not self._gap_mode or len(self._heat_data) == 1:
+        def lap_results(target:pilot_target, gap_info):
+            if not self._options.gap_mode or len(targets) == 1:
                 formatted_time = RHUtils.time_format(gap_info.current.last_lap_time, '{m}:{s}.{d}')
-                message = f">> LAP {gap_info.current.lap_number} | {formatted_time} <<"
+                message = self._LAP_TIME_TEMPLATE.fill(gap_info.current.lap_number, formatted_time)
             elif gap_info.next_rank.position:
                 formatted_time = RHUtils.time_format(gap_info.next_rank.diff_time, '{m}:{s}.{d}')
                 formatted_callsign = str.upper(gap_info.next_rank.callsign)
-                message = f">> {formatted_callsign} | +{formatted_time} <<"
+                message = self._GAP_TEMPLATE.fill(formatted_callsign, formatted_time)
             else:
-                message = self._leader_message
+                message = self._options.leader_message
         
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_lapresults(message, hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            delay = copy.copy(self._results_uptime)
-            self._queue_lock.release()
+            txn = self.begin_transaction(target, sendPriority.LAP, ('lapresults', target.pilot_id), event_time)
+            self.send_lapresults(txn, message, target.hardware)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
-            time.sleep(delay)
+            self.schedule_clear(txn.held + self._options.results_uptime, clear_results, target, self._options.lapresults_row)
 
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_clear_lapresults(hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def clear_results(target:pilot_target):
+            txn = self.begin_transaction(target, sendPriority.LAP, ('lapresults', target.pilot_id))
+            self.send_clear_lapresults(txn, target.hardware)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
 
-        self._queue_lock.acquire()
-        if self._heat_data == {}:
+        if targets == {}:
             return
 
-        if args['pilot_done_flag']:
-            self._finished_pilots.append(args['pilot_id'])
-
-        results = args['results']['by_race_time']
-        for result in results:
-            if self._heat_data[result['pilot_id']]:
-                
-                if result['pilot_id'] not in self._finished_pilots:
-                    Thread(target=update_pos, args=(result,), daemon=True).start()
+        with self._queue_lock:
+            if args['pilot_done_flag']:
+                self._finished_pilots.append(args['pilot_id'])
 
-                if (result['pilot_id'] == args['pilot_id']) and (result['laps'] > 0):
-                    Thread(target=lap_results, args=(result, args['gap_info']), daemon=True).start()
-        
-        self._queue_lock.release()
+            results = args['results']['by_race_time']
+            for result in results:
+                target = targets.get(result['pilot_id'])
+                if target:
+                    
+                    if result['pilot_id'] not in self._finished_pilots:
+                        # Crossings within the window collapse into the newest line, unchanged lines are not resent
+                        message = position_message(result)
+                        if self._positions_shown.get(result['pilot_id']) != message:
+                            self._positions_shown[result['pilot_id']] = message
+                            self._scheduler.schedule(self._options.lap_window, update_pos, target, message,
+                                                     key=('position', result['pilot_id']))
+
+                    if (result['pilot_id'] == args['pilot_id']) and (result['laps'] > 0):
+                        self._scheduler.submit(lap_results, target, args['gap_info'])
     
     def onLapDelete(self, _args):
         
-        def delete(pilot_id):
-            self._queue_lock.acquire()
-            if self._heat_data[pilot_id]:
-                self.set_sendUID(self._heat_data[pilot_id]['UID'])
-                self.send_clear(self._heat_data[pilot_id]['hardware_type'], False)
-                self.send_display()
-                self.clear_sendUID()
-            self._queue_lock.release()
+        def delete(target:pilot_target):
+            txn = self.begin_transaction(target)
+            self.send_clear(txn, target.hardware, False)
+            self.send_display(txn)
+            self.submit_transaction(txn)
         
-        with self._queue_lock:
-            if self._results_mode:
-                for pilot_id in self._heat_data:
-                    Thread(target=delete, args=(pilot_id,), daemon=True).start()
+        if self._options.results_mode:
+            with self._queue_lock:
+                self.reset_positions()
+
+            for target in self._targets.values():
+                if target:
+                    self._scheduler.submit(delete, target)
             
 
     def onRacePilotDone(self, args):
+        event_time = time.monotonic()
 
-        def done(result):
-
-            self._queue_lock.acquire()
-            pilot_id = result['pilot_id']
-            hardwareType = self._heat_data[pilot_id]['hardware_type']
+        def done(target:pilot_target, result):
+            hardwareType = target.hardware
         
-            self.set_sendUID(self._heat_data[result['pilot_id']]['UID'])
-            if hardwareType != 'betaflight_craftname':
-                self.send_clear_currentlap(hardwareType)
+            txn = self.begin_transaction(target, sendPriority.STATUS, ('status', target.pilot_id), event_time)
+            if not target.is_craftname:
+                self.send_clear_currentlap(txn, hardwareType)
             
-            self.send_status(self._pilotdone_message, hardwareType)
-
-            if self._results_mode:
-                self.send_msg(10, 11, "PLACEMENT:", hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(10, 30, str(result['position']), hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(11, 11, "LAPS COMPLETED:", hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(11, 30, str(result['laps']), hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(12, 11, "FASTEST LAP:", hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(12, 30, result['fastest_lap'], hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(13, 11, "FASTEST " + str(result['consecutives_base']) +  " CONSEC:", hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(13, 30, result['consecutives'], hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(14, 11, "TOTAL TIME:", hardwareType, False)
-                if hardwareType == 'betaflight_craftname':
-                    time.sleep(1)
-                self.send_msg(14, 30, result['total_time'], hardwareType, False)
+            self.send_status(txn, self._options.pilotdone_message, hardwareType)
+
+            if self._options.results_mode:
+                results_fields = [
+                    (10, 11, "PLACEMENT:"),
+                    (10, 30, str(result['position'])),
+                    (11, 11, "LAPS COMPLETED:"),
+                    (11, 30, str(result['laps'])),
+                    (12, 11, "FASTEST LAP:"),
+                    (12, 30, result['fastest_lap']),
+                    (13, 11, "FASTEST " + str(result['consecutives_base']) +  " CONSEC:"),
+                    (13, 30, result['consecutives']),
+                    (14, 11, "TOTAL TIME:"),
+                    (14, 30, result['total_time']),
+                ]
+                for index, (row, col, text) in enumerate(results_fields):
+                    if index and target.is_craftname:
+                        txn.hold(1)
+                    self.send_msg(txn, row, col, text, hardwareType, False)
             
-            self.send_display()
-            self.clear_sendUID()
-            delay = copy.copy(self._finish_uptime)
-            self._queue_lock.release()
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
-            time.sleep(delay)
+            self.schedule_clear(txn.held + self._options.finish_uptime, clear, target, self._options.status_row)
 
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_clear_status(hardwareType, False)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def clear(target:pilot_target):
+            txn = self.begin_transaction(target, sendPriority.STATUS, ('status', target.pilot_id))
+            self.send_clear_status(txn, target.hardware, False)
+            self.send_display(txn)
+            self.submit_transaction(txn)
+
+        target = self._targets.get(args['pilot_id'])
+        if not target:
+            return
 
-        results = args['results']['by_race_time']
+        # A position update still in its window would redraw the cleared lap row
         with self._queue_lock:
-            for result in results:
-                if (self._heat_data[args['pilot_id']]) and (result['pilot_id'] == args['pilot_id']):
-                    Thread(target=done, args=(result,), daemon=True).start()
-                    break
+            self._scheduler.cancel(('position', args['pilot_id']))
+            self._positions_shown.pop(args['pilot_id'], None)
+
+        for result in args['results']['by_race_time']:
+            if result['pilot_id'] == args['pilot_id']:
+                self._scheduler.submit(done, target, result)
+                break
 
     def onLapsClear(self, _args):
         
-        def clear(pilot_id):
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot_id]['UID'])
-            self.send_clear(self._heat_data[pilot_id]['hardware_type'], False)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def clear(target:pilot_target):
+            txn = self.begin_transaction(target)
+            self.send_clear(txn, target.hardware, False)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
         with self._queue_lock:
             self._finished_pilots = []
-            for pilot_id in self._heat_data:
-                if self._heat_data[pilot_id]:
-                    Thread(target=clear, args=(pilot_id,), daemon=True).start()
+            self.reset_positions()
+
+        for target in self._targets.values():
+            if target:
+                self._scheduler.submit(clear, target)
 
     def onSendMessage(self, args):
         
-        def notify(pilot):
+        def notify(txn:osd_transaction, target:pilot_target):
+            self.send_announcement(txn, args['message'], target.hardware)
+            self.send_display(txn)
 
-            hardwareType = self._heat_data[pilot]['hardware_type']
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot]['UID'])
-            self.send_announcement(args['message'], hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            delay = copy.copy(self._announcement_uptime)
-            self._queue_lock.release()
-
-            time.sleep(delay)
+            self.schedule_clear(txn.held + self._options.announcement_uptime, clear, target, self._options.announcement_row)
 
-            self._queue_lock.acquire()
-            self.set_sendUID(self._heat_data[pilot]['UID'])
-            self.send_clear_announcement(hardwareType)
-            self.send_display()
-            self.clear_sendUID()
-            self._queue_lock.release()
+        def clear(target:pilot_target):
+            txn = self.begin_transaction(target, sendPriority.COSMETIC, ('announcement', target.pilot_id))
+            self.send_clear_announcement(txn, target.hardware)
+            self.send_display(txn)
+            self.submit_transaction(txn)
 
-        with self._queue_lock:
-            for pilot_id in self._heat_data:
-                if self._heat_data[pilot_id]:
-                    Thread(target=notify, args=(pilot_id,), daemon=True).start()
\ No newline at end of file
+        targets = [target for target in self._targets.values() if target]
+        self._scheduler.submit(self.broadcast, targets, notify, sendPriority.COSMETIC, 'announcement', time.monotonic())
@@ -0,0 +1,68 @@
+#
+# OSD framebuffer
+#
+
+# Bytes added by every extra SET_OSD write: MSP v2 framing plus [0x03, row, col, 0]
+SPAN_OVERHEAD = 13
+
+class osd_framebuffer():
+    '''
+    Shadow copy of a pilot's character OSD. Drawing operations update the
+    pending screen; flush() returns the minimal spans that differ from what
+    was last sent and marks them as shown.
+    '''
+
+    def __init__(self, rows:int, cols:int):
+        self.rows = rows
+        self.cols = cols
+        self._shown = bytearray(rows * cols)
+        self._pending = bytearray(rows * cols)
+        self.cleared = False
+
+    def write(self, row:int, col:int, data:bytes):
+        if not 0 <= row < self.rows or col >= self.cols:
+            return
+        data = data[:self.cols - col]
+        start = row * self.cols + col
+        self._pending[start:start + len(data)] = data
+
+    def clear_row(self, row:int):
+        if 0 <= row < self.rows:
+            start = row * self.cols
+            self._pending[start:start + self.cols] = bytes(self.cols)
+
+    def clear(self):
+        # The goggles were cleared as a whole, nothing is shown anymore
+        self._shown = bytearray(self.rows * self.cols)
+        self._pending = bytearray(self.rows * self.cols)
+        self.cleared = True
+
+    def flush(self) -> list:
+        spans = []
+        shown = self._shown
+        pending = self._pending
+        cols = self.cols
+
+        for row in range(self.rows):
+            start = row * cols
+            end = start + cols
+            if shown[start:end] == pending[start:end]:
+                continue
+
+            span_start = None
+            span_end = None
+            for index in range(start, end):
+                if shown[index] == pending[index]:
+                    continue
+                if span_start is not None and index - span_end > SPAN_OVERHEAD:
+                    spans.append((row, span_start - start, bytes(pending[span_start:span_end])))
+                    span_start = None
+                if span_start is None:
+                    span_start = index
+                span_end = index + 1
+
+            spans.append((row, span_start - start, bytes(pending[span_start:span_end])))
+            shown[start:end] = pending[start:end]
+
+        self.cleared = False
+        return spans
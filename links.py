@@ -0,0 +1,103 @@
+from threading import Lock
+
+#
+# Backpack links
+#
+
+class backpack_link():
+    '''
+    One connected backpack with its own send queue and transport.
+    '''
+
+    def __init__(self, device, send_queue, transport=None):
+        self.device = device
+        self.queue = send_queue
+        self.transport = transport
+
+class link_pool():
+    '''
+    The connected backpacks and which one carries each pilot's OSD traffic.
+    A pilot stays on its link while that link is up. Pilots that send
+    before being assigned go to the link with the fewest queued bytes; a
+    heat assigned up front is spread by pilot count.
+    Traffic that is not addressed to a pilot goes to every link.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._links = []
+        self._assigned = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._links)
+
+    def links(self) -> list:
+        with self._lock:
+            return list(self._links)
+
+    def devices(self) -> set:
+        with self._lock:
+            return {link.device for link in self._links}
+
+    def add(self, link:backpack_link):
+        with self._lock:
+            self._links.append(link)
+
+    def remove(self, link:backpack_link) -> list:
+        # Returns what was still queued on the link, its pilots are reassigned on their next send
+        with self._lock:
+            if link in self._links:
+                self._links.remove(link)
+            self._assigned = {pilot_id: assigned for pilot_id, assigned in self._assigned.items()
+                              if assigned is not link}
+        return link.queue.drain()
+
+    def route(self, pilot_id=None) -> list:
+        with self._lock:
+            if not self._links:
+                return []
+            if pilot_id is None or len(self._links) == 1:
+                return list(self._links)
+
+            link = self._assigned.get(pilot_id)
+            if link is None:
+                link = self._least_loaded()
+                self._assigned[pilot_id] = link
+            return [link]
+
+    def assign(self, pilot_ids):
+        # Spreads a heat's pilots over the links before its first message
+        with self._lock:
+            if len(self._links) < 2:
+                return
+            for pilot_id in pilot_ids:
+                if pilot_id not in self._assigned:
+                    self._assigned[pilot_id] = self._least_loaded(by_bytes=False)
+
+    def _least_loaded(self, by_bytes=True) -> backpack_link:
+        pilots = {id(link): 0 for link in self._links}
+        for link in self._assigned.values():
+            if id(link) in pilots:
+                pilots[id(link)] += 1
+
+        if by_bytes:
+            return min(self._links, key=lambda link: (link.queue.queued_bytes(), pilots[id(link)]))
+        return min(self._links, key=lambda link: (pilots[id(link)], link.queue.queued_bytes()))
+
+    def empty(self) -> bool:
+        return all(link.queue.empty() for link in self.links())
+
+    def stats(self) -> dict:
+        with self._lock:
+            pilots = {}
+            for pilot_id, link in self._assigned.items():
+                pilots.setdefault(link.device, []).append(pilot_id)
+            return {
+                str(link.device) : {
+                    'pilots'        : sorted(pilots.get(link.device, []), key=str),
+                    'queued_bytes'  : link.queue.queued_bytes(),
+                    'queue'         : link.queue.stats(),
+                }
+                for link in self._links
+            }
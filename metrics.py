@@ -0,0 +1,197 @@
+import bisect
+import time
+
+from collections import deque
+from threading import Lock
+
+#
+# Delivery metrics
+#
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class tracked_frames(tuple):
+    '''
+    Frames of one send queue item, tagged with what produced them so the
+    transport can report when they reached the wire.
+    '''
+    kind = None
+    pilot_id = None
+    event_time = None
+    enqueued = None
+    route = None
+    members = ()
+
+class latency_histogram():
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, seconds:float):
+        ms = seconds * 1e3
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, fraction:float) -> float:
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.count:
+            return 0
+        threshold = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                if index < len(LATENCY_BUCKETS_MS):
+                    return LATENCY_BUCKETS_MS[index]
+                return self.max
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count'     : self.count,
+            'avg_ms'    : self.total / self.count if self.count else 0,
+            'p95_ms'    : self.percentile(0.95),
+            'max_ms'    : self.max,
+            'buckets'   : dict(zip([str(bound) for bound in LATENCY_BUCKETS_MS] + ['inf'], self.counts)),
+        }
+
+class delivery_metrics():
+    '''
+    Counters for the backpack pipeline: latency from the triggering event
+    and from enqueueing to the last byte written, per message kind and per
+    pilot, plus drops, write errors and inbound packets. The most recent
+    deliveries are kept with their timestamps. Race control commands from
+    the transmitter are timed from packet to action.
+    '''
+
+    RECENT_SIZE = 256
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = self._clock()
+            self._by_kind = {}
+            self._by_pilot = {}
+            self._queue_latency = latency_histogram()
+            self._recent = deque(maxlen=self.RECENT_SIZE)
+            self._items = 0
+            self._frames = 0
+            self._bytes = 0
+            self._dropped = 0
+            self._offline = 0
+            self._write_errors = 0
+            self._packets = {}
+            self._commands = {}
+            self._commands_suppressed = 0
+
+    def tag(self, frames:tuple, kind=None, pilot_id=None, event_time=None) -> tracked_frames:
+        item = tracked_frames(frames)
+        item.kind = kind
+        item.pilot_id = pilot_id
+        item.enqueued = self._clock()
+        item.event_time = event_time if event_time is not None else item.enqueued
+        return item
+
+    def record_delivery(self, item, frames:int, size:int):
+        written = self._clock()
+        with self._lock:
+            self._items += 1
+            self._frames += frames
+            self._bytes += size
+
+            if not isinstance(item, tracked_frames):
+                return
+
+            kind = item.kind or 'other'
+            latency = written - item.event_time
+            self._by_kind.setdefault(kind, latency_histogram()).add(latency)
+            if item.pilot_id is not None:
+                self._by_pilot.setdefault(item.pilot_id, latency_histogram()).add(latency)
+            self._queue_latency.add(written - item.enqueued)
+            self._recent.append((kind, item.pilot_id, frames, item.event_time, item.enqueued, written))
+
+    def record_drop(self):
+        with self._lock:
+            self._dropped += 1
+
+    def record_offline(self):
+        with self._lock:
+            self._offline += 1
+
+    def record_write_error(self):
+        with self._lock:
+            self._write_errors += 1
+
+    def record_packet(self, mode:int):
+        with self._lock:
+            self._packets[mode] = self._packets.get(mode, 0) + 1
+
+    def record_command(self, command:str, latency:float):
+        with self._lock:
+            self._commands.setdefault(command, latency_histogram()).add(latency)
+
+    def record_command_suppressed(self):
+        with self._lock:
+            self._commands_suppressed += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'uptime_s'          : self._clock() - self._started,
+                'items_sent'        : self._items,
+                'frames_sent'       : self._frames,
+                'bytes_sent'        : self._bytes,
+                'dropped'           : self._dropped,
+                'held_offline'      : self._offline,
+                'write_errors'      : self._write_errors,
+                'inbound_packets'   : {f'{mode:#06x}': count for mode, count in self._packets.items()},
+                'race_control'      : {
+                    'latency'       : {command: histogram.to_dict() for command, histogram in self._commands.items()},
+                    'suppressed'    : self._commands_suppressed,
+                },
+                'queue_latency'     : self._queue_latency.to_dict(),
+                'latency_by_kind'   : {kind: histogram.to_dict() for kind, histogram in self._by_kind.items()},
+                'latency_by_pilot'  : {str(pilot_id): histogram.to_dict() for pilot_id, histogram in self._by_pilot.items()},
+                'recent'            : [
+                    {
+                        'kind'      : kind,
+                        'pilot_id'  : pilot_id,
+                        'frames'    : frames,
+                        'event'     : event_time,
+                        'enqueued'  : enqueued,
+                        'written'   : written,
+                    }
+                    for kind, pilot_id, frames, event_time, enqueued, written in self._recent
+                ],
+            }
+
+def format_metrics(snapshot:dict) -> str:
+    # Markdown summary for the settings panel
+    lines = [
+        f"Sent: {snapshot['items_sent']} updates, {snapshot['frames_sent']} frames, {snapshot['bytes_sent']} bytes",
+        f"Dropped: {snapshot['dropped']}, held offline: {snapshot['held_offline']}, write errors: {snapshot['write_errors']}",
+        f"Inbound packets: {sum(snapshot['inbound_packets'].values())}",
+    ]
+
+    queue = snapshot.get('send_queue', {})
+    if queue:
+        lines.append('Queue high-water: ' + ', '.join(f"{name} {counts['high_water']}" for name, counts in queue.items()))
+
+    latency = snapshot['queue_latency']
+    lines.append(f"Queue to wire: avg {latency['avg_ms']:.1f} ms, p95 {latency['p95_ms']:.0f} ms, max {latency['max_ms']:.1f} ms")
+    for kind, latency in sorted(snapshot['latency_by_kind'].items()):
+        lines.append(f"Event to wire, {kind}: avg {latency['avg_ms']:.1f} ms, p95 {latency['p95_ms']:.0f} ms, max {latency['max_ms']:.1f} ms")
+    for command, latency in sorted(snapshot['race_control']['latency'].items()):
+        lines.append(f"Race control {command}: {latency['count']} commands, avg {latency['avg_ms']:.1f} ms, max {latency['max_ms']:.1f} ms")
+
+    return '\n\n'.join(lines)
@@ -1,8 +1,161 @@
 from dataclasses import dataclass
+from collections import OrderedDict
+from threading import Lock
+
+#
+# CRC8 DVB-S2 lookup table
+#
+
+def _build_crc8_table(poly=0xD5):
+    table = []
+    for value in range(256):
+        crc = value
+        for _ in range(8):
+            if crc & 0x80:
+                crc = ((crc << 1) ^ poly) & 0xFF
+            else:
+                crc = (crc << 1) & 0xFF
+        table.append(crc)
+    return bytes(table)
+
+_CRC8_DVB_S2_TABLE = _build_crc8_table()
+
+def crc8_dvb_s2(data, crc=0):
+    table = _CRC8_DVB_S2_TABLE
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+#
+# MSP v2 frame encoding
+#
+
+_MSP_HEADER = b'$X<'
+_MSP_OVERHEAD = 9 # header(3) + flag(1) + function(2) + size(2) + crc(1)
+
+def encode_msp(function:int, payload=b'') -> bytes:
+    size = len(payload)
+    frame = bytearray(_MSP_OVERHEAD + size)
+    view = memoryview(frame)
+
+    view[0:3] = _MSP_HEADER
+    frame[3] = 0
+    frame[4] = function & 0xFF
+    frame[5] = (function >> 8) & 0xFF
+    frame[6] = size & 0xFF
+    frame[7] = (size >> 8) & 0xFF
+    view[8:8 + size] = bytes(payload)
+    frame[-1] = crc8_dvb_s2(view[3:-1])
+
+    return bytes(frame)
+
+#
+# Streaming MSP v2 parser
+#
+
+class msp_parser():
+    '''
+    Incremental MSP v2 decoder. Accepts arbitrary byte chunks, resynchronizes
+    on the '$X' header after noise or partial frames, validates the CRC8
+    DVB-S2 checksum and returns the decoded (function, payload) frames.
+    '''
+
+    def __init__(self, max_payload=1024, directions=b'<>'):
+        self._buffer = bytearray()
+        self._max_payload = max_payload
+        self._directions = directions
+        self.frames = 0
+        self.crc_errors = 0
+        self.discarded = 0
+
+    def reset(self):
+        self._buffer.clear()
+
+    def _discard(self, count):
+        del self._buffer[:count]
+        self.discarded += count
+
+    def feed(self, data) -> list:
+        buffer = self._buffer
+        buffer += data
+        frames = []
+
+        while buffer:
+            start = buffer.find(b'$X')
+            if start < 0:
+                # Keep a trailing '$' that may start the next header
+                self._discard(len(buffer) - 1 if buffer[-1] == 0x24 else len(buffer))
+                break
+            if start:
+                self._discard(start)
+
+            if len(buffer) < 8:
+                break
+
+            size = buffer[6] | (buffer[7] << 8)
+            if buffer[2] not in self._directions or size > self._max_payload:
+                self._discard(1)
+                continue
+
+            end = _MSP_OVERHEAD + size
+            if len(buffer) < end:
+                break
+
+            if crc8_dvb_s2(memoryview(buffer)[3:end - 1]) != buffer[end - 1]:
+                self.crc_errors += 1
+                self._discard(1)
+                continue
+
+            frames.append((buffer[4] | (buffer[5] << 8), bytes(buffer[8:end - 1])))
+            del buffer[:end]
+
+        self.frames += len(frames)
+        return frames
+
+#
+# Encoded frame cache
+#
+
+class msp_frame_cache():
+
+    def __init__(self, maxsize=256):
+        self._maxsize = maxsize
+        self._frames = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, function:int, payload=b'') -> bytes:
+        key = (function, bytes(payload))
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is not None:
+                self._frames.move_to_end(key)
+                self.hits += 1
+                return frame
+            self.misses += 1
+
+        frame = encode_msp(function, key[1])
+
+        with self._lock:
+            self._frames[key] = frame
+            if len(self._frames) > self._maxsize:
+                self._frames.popitem(last=False)
+        return frame
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits'      : self.hits,
+                'misses'    : self.misses,
+                'size'      : len(self._frames),
+                'maxsize'   : self._maxsize,
+            }
 
 class msp_message():
 
-    _payload = []
+    _function = 0
+    _payload = b''
 
     def _convert_values(self, value):
         a = value%256
@@ -10,9 +163,9 @@ class msp_message():
         return [a, b]
 
     def set_function(self, function):
-        self._function = self._convert_values(function)
+        self._function = function
 
-    def set_payload(self, payload:list):
+    def set_payload(self, payload):
         self._payload = payload
 
     def _payload_size(self):
@@ -20,31 +173,13 @@ class msp_message():
         return self._convert_values(size)
 
     def _crc8_dvb_s2(self, crc, a):
-        crc = crc ^ a
-        for ii in range(8):
-            if crc & 0x80:
-                crc = (crc << 1) ^ 0xD5
-            else:
-                crc = crc << 1
-        return crc & 0xFF
+        return _CRC8_DVB_S2_TABLE[crc ^ a]
     
     def _calculate_checksum(self, body):
-        crc = 0
-        for x in body:
-            crc = self._crc8_dvb_s2(crc, x)
-        return crc
-
-    def get_msp(self):
-        msp = [ord('$'), ord('X'), ord('<')]
-
-        body = [0]
-        body += self._function
-        body += self._payload_size()
-        body += self._payload
-        
-        checksum = self._calculate_checksum(body)
-        msp += body + [checksum]
-        return msp
+        return crc8_dvb_s2(body)
+
+    def get_msp(self) -> bytes:
+        return encode_msp(self._function, self._payload)
 
 #
 # ExpressLRS Backpack MSPTypes
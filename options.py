@@ -0,0 +1,116 @@
+from types import MappingProxyType
+
+from plugins.VRxC_ELRS.templates import compile_line
+
+#
+# Plugin options
+#
+
+# Options read by the controller, with the defaults registered in __init__.py
+OPTION_DEFAULTS = MappingProxyType({
+    '_race_control'         : '0',
+    '_osd_full_rows'        : '0',
+    '_bp_batch'             : '0',
+    '_bp_multi'             : '0',
+    '_bp_adaptive'          : '0',
+    '_heat_name'            : '0',
+    '_position_mode'        : '0',
+    '_gap_mode'             : '0',
+    '_results_mode'         : '0',
+    '_racestage_message'    : '>> ARM NOW <<',
+    '_racestart_message'    : '>>   GO!   <<',
+    '_pilotdone_message'    : '>> FINISHED! <<',
+    '_racefinish_message'   : '>> FINISH LAP! <<',
+    '_racestop_message'     : '>>  LAND NOW!  <<',
+    '_leader_message'       : '>> RACE LEADER <<',
+    '_racestart_uptime'     : 5,
+    '_finish_uptime'        : 20,
+    '_results_uptime'       : 40,
+    '_announcement_uptime'  : 50,
+    '_lap_window'           : 100,
+    '_status_row'           : 5,
+    '_currentlap_row'       : 0,
+    '_lapresults_row'       : 15,
+    '_announcement_row'     : 6,
+    '_bp_repeat'            : 0,
+    '_bp_delay'             : 80,
+    '_bp_delay_min'         : 0,
+    '_bp_transport'         : 'selector',
+    '_bp_batch_size'        : 256,
+})
+
+class osd_options():
+    '''
+    Immutable snapshot of the plugin options, converted to the units the
+    handlers use. A changed option produces a new snapshot, which the
+    controller publishes by replacing its reference, so readers need no
+    lock and never touch the database.
+    '''
+
+    __slots__ = (
+        'raw',
+        'race_control', 'multi_link', 'transport',
+        'heat_name', 'position_mode', 'gap_mode', 'results_mode', 'diff_updates',
+        'racestage_message', 'racestart_message', 'pilotdone_message',
+        'racefinish_message', 'racestop_message', 'leader_message',
+        'racestart_uptime', 'finish_uptime', 'results_uptime', 'announcement_uptime', 'lap_window',
+        'status_row', 'currentlap_row', 'lapresults_row', 'announcement_row',
+        'repeat_count', 'send_delay', 'min_delay', 'adaptive', 'batch_limit',
+    )
+
+    def __init__(self, raw=OPTION_DEFAULTS):
+        values = {
+            'raw'                   : MappingProxyType(dict(raw)),
+
+            'race_control'          : raw['_race_control'] == '1',
+            'multi_link'            : raw['_bp_multi'] == '1',
+            'transport'             : raw['_bp_transport'],
+
+            'heat_name'             : raw['_heat_name'] == '1',
+            'position_mode'         : raw['_position_mode'] == '1',
+            'gap_mode'              : raw['_gap_mode'] == '1',
+            'results_mode'          : raw['_results_mode'] == '1',
+            'diff_updates'          : raw['_osd_full_rows'] != '1',
+
+            # Configured messages are encoded here rather than for every pilot and event
+            'racestage_message'     : compile_line(raw['_racestage_message']),
+            'racestart_message'     : compile_line(raw['_racestart_message']),
+            'pilotdone_message'     : compile_line(raw['_pilotdone_message']),
+            'racefinish_message'    : compile_line(raw['_racefinish_message']),
+            'racestop_message'      : compile_line(raw['_racestop_message']),
+            'leader_message'        : compile_line(raw['_leader_message']),
+
+            'racestart_uptime'      : raw['_racestart_uptime'] * 1e-1,
+            'finish_uptime'         : raw['_finish_uptime'] * 1e-1,
+            'results_uptime'        : raw['_results_uptime'] * 1e-1,
+            'announcement_uptime'   : raw['_announcement_uptime'] * 1e-1,
+            'lap_window'            : raw['_lap_window'] * 1e-3,
+
+            'status_row'            : raw['_status_row'],
+            'currentlap_row'        : raw['_currentlap_row'],
+            'lapresults_row'        : raw['_lapresults_row'],
+            'announcement_row'      : raw['_announcement_row'],
+
+            'repeat_count'          : raw['_bp_repeat'],
+            'send_delay'            : raw['_bp_delay'] * 1e-5,
+            'min_delay'             : raw['_bp_delay_min'] * 1e-5,
+            'adaptive'              : raw['_bp_adaptive'] == '1',
+            'batch_limit'           : raw['_bp_batch_size'] if raw['_bp_batch'] == '1' else 0,
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('osd_options is immutable')
+
+    @classmethod
+    def load(cls, db) -> 'osd_options':
+        return cls({name: db.option(name) for name in OPTION_DEFAULTS})
+
+    def replace(self, name, value) -> 'osd_options':
+        # Returns this snapshot when the option is not one of ours or has not changed
+        if name not in OPTION_DEFAULTS or self.raw[name] == value:
+            return self
+        raw = dict(self.raw)
+        raw[name] = value
+        return osd_options(raw)
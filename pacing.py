@@ -0,0 +1,117 @@
+import time
+
+from threading import Lock
+
+#
+# Backpack send pacing
+#
+
+# Serial line rate the backpack is opened with, in bytes per second (8N1)
+LINE_RATE = 460800 / 10
+
+class send_pacer():
+    '''
+    Inter-frame gap and repeat count for backpack writes.
+
+    With adaptive pacing off, the configured delay and repeat count are used
+    as they are. With it on, the gap grows quickly while writes block or the
+    serial output buffer has not drained by the end of the gap, and shrinks
+    slowly while it keeps up, within [min_delay, max_delay]. Repeats are spent only while the send
+    queue has no backlog, up to max_repeat.
+
+    The measured frame rate is kept either way.
+    '''
+
+    BACKLOG_HIGH = 8
+    IDLE_SENDS = 20
+    RATE_WINDOW = 1.0
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = Lock()
+
+        self._adaptive = False
+        self._min_delay = 0
+        self._max_delay = 0
+        self._max_repeat = 0
+
+        self.delay = 0
+        self.repeat = 0
+        self._quiet = 0
+
+        self._window_start = clock()
+        self._window_frames = 0
+        self._last_frame = None
+        self._rate = 0
+
+    def configure(self, delay, repeat, adaptive=False, min_delay=0):
+        with self._lock:
+            started = adaptive and not self._adaptive
+            self._adaptive = adaptive
+            self._max_delay = delay
+            self._min_delay = min(min_delay, delay)
+            self._max_repeat = repeat
+
+            if not adaptive or started:
+                # Adaptive pacing starts from the configured values and works down
+                self.delay = delay
+                self.repeat = repeat
+            else:
+                self.delay = min(max(self.delay, self._min_delay), self._max_delay)
+                self.repeat = min(self.repeat, self._max_repeat)
+
+    def record_write(self, size:int, elapsed:float, pending:int):
+        # Called by the transport after every serial write. pending is what the
+        # output buffer still held when the write started, after the gap.
+        if not self._adaptive:
+            return
+
+        step = (self._max_delay - self._min_delay) / 16
+        with self._lock:
+            if pending or elapsed > 2 * size / LINE_RATE:
+                # The UART is not keeping up, back off
+                self.delay = min(self._max_delay, self.delay * 2 + step)
+            else:
+                self.delay = max(self._min_delay, self.delay - step)
+
+    def record_backlog(self, depth:int):
+        # Called by the transport before draining the send queue
+        if not self._adaptive:
+            return
+
+        with self._lock:
+            if depth >= self.BACKLOG_HIGH:
+                self.repeat = 0
+                self._quiet = 0
+            elif depth <= 1:
+                self._quiet += 1
+                if self._quiet >= self.IDLE_SENDS and self.repeat < self._max_repeat:
+                    self.repeat += 1
+                    self._quiet = 0
+
+    def record_frames(self, count:int):
+        now = self._clock()
+        with self._lock:
+            self._window_frames += count
+            self._last_frame = now
+            elapsed = now - self._window_start
+            if elapsed >= self.RATE_WINDOW:
+                self._rate = self._window_frames / elapsed
+                self._window_frames = 0
+                self._window_start = now
+
+    def frame_rate(self) -> float:
+        with self._lock:
+            if self._last_frame is None or self._clock() - self._last_frame > 2 * self.RATE_WINDOW:
+                return 0
+            return self._rate
+
+    def stats(self) -> dict:
+        rate = self.frame_rate()
+        with self._lock:
+            return {
+                'adaptive'      : self._adaptive,
+                'delay_us'      : self.delay * 1e6,
+                'repeat'        : self.repeat,
+                'frames_per_s'  : rate,
+            }
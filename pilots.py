@@ -0,0 +1,71 @@
+import hashlib
+
+from functools import lru_cache
+
+from plugins.VRxC_ELRS.hardware import hardwareOptions, HARDWARE_SETTINGS
+from plugins.VRxC_ELRS.msp import msptypes, encode_msp
+
+#
+# Pilot targets
+#
+
+@lru_cache(maxsize=256)
+def phrase_uid(bindphrase:str) -> bytes:
+    # UID the ELRS firmware derives from a binding phrase (or callsign)
+    bindingPhraseHash = bytearray(hashlib.md5(("-DMY_BINDING_PHRASE=\"" + bindphrase + "\"").encode()).digest()[0:6])
+    if (bindingPhraseHash[0] % 2) == 1:
+        bindingPhraseHash[0] -= 0x01
+    return bytes(bindingPhraseHash)
+
+def resolve_hardware(hardware_type:str) -> hardwareOptions:
+    # Returns None for pilots without a supported OSD
+    if hardware_type not in HARDWARE_SETTINGS:
+        return None
+    return hardwareOptions(hardware_type)
+
+class pilot_target():
+    '''
+    Everything the OSD handlers need to address one pilot, resolved once
+    when the heat is set instead of on every event.
+    '''
+
+    __slots__ = (
+        'pilot_id',
+        'hardware',
+        'uid',
+        'uid_frame',
+        'identifier',
+        'rows',
+        'cols',
+        'last_message',
+    )
+
+    def __init__(self, pilot_id, hardware:hardwareOptions, uid:bytes):
+        self.pilot_id = pilot_id
+        self.hardware = hardware
+        self.uid = bytes(uid)
+        self.uid_frame = encode_msp(msptypes.MSP_ELRS_SET_SEND_UID, b'\x01' + self.uid)
+        self.identifier = '.'.join(map(str, self.uid))
+
+        settings = HARDWARE_SETTINGS.get(hardware.value, {})
+        self.rows = settings.get('column_size')
+        self.cols = settings.get('row_size')
+
+        # Last persistent craftname message, restored after temporary ones
+        self.last_message = None
+
+    @property
+    def is_craftname(self) -> bool:
+        return self.hardware is hardwareOptions.BETAFLIGHT_CRAFTNAME
+
+def carry_over(targets:dict, previous:dict) -> dict:
+    # Persistent messages belong to the goggles, so they follow the UID into the new registry
+    messages = {}
+    for target in previous.values():
+        if target and target.last_message is not None:
+            messages[target.identifier] = target.last_message
+
+    for target in targets.values():
+        if target and target.last_message is None:
+            target.last_message = messages.get(target.identifier)
+    return targets
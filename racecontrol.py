@@ -0,0 +1,63 @@
+import time
+
+from collections import deque
+from threading import Lock
+
+import gevent
+
+#
+# Race control from the transmitter
+#
+
+class command_debounce():
+    '''
+    Drops repeats of a race control command. Transmitters send the
+    recording state more than once, and with several backpacks every link
+    delivers its own copy.
+    '''
+
+    def __init__(self, interval=1.0, clock=time.monotonic):
+        self._interval = interval
+        self._clock = clock
+        self._lock = Lock()
+        self._last = None
+        self._last_time = None
+
+    def accept(self, command, now=None) -> bool:
+        now = self._clock() if now is None else now
+        with self._lock:
+            if command == self._last and now - self._last_time < self._interval:
+                return False
+            self._last = command
+            self._last_time = now
+            return True
+
+class hub_dispatcher():
+    '''
+    Runs callables in greenlets on the gevent hub the dispatcher was created
+    on, from any thread. gevent.spawn() is only safe from the hub's own
+    thread, so other threads queue the call and wake the hub through an
+    async watcher.
+    '''
+
+    def __init__(self):
+        self._pending = deque()
+        try:
+            self._watcher = gevent.get_hub().loop.async_()
+        except AttributeError:
+            # gevent without async watchers, spawn from the calling thread
+            self._watcher = None
+            return
+        self._watcher.start(self._run_pending)
+
+    def submit(self, fn, *args):
+        if self._watcher is None:
+            gevent.spawn(fn, *args)
+            return
+        self._pending.append((fn, args))
+        self._watcher.send()
+
+    def _run_pending(self):
+        while self._pending:
+            fn, args = self._pending.popleft()
+            gevent.spawn(fn, *args)
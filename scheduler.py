@@ -0,0 +1,130 @@
+import logging
+import heapq
+import itertools
+import time
+import queue
+
+from threading import Thread, Condition, Lock
+
+logger = logging.getLogger(__name__)
+
+#
+# OSD task scheduler
+#
+
+class osd_scheduler():
+    '''
+    Fixed pool of worker threads for immediate OSD sends plus a single
+    timer thread for delayed actions, so the thread count stays constant
+    regardless of the number of pilots or laps.
+    '''
+
+    def __init__(self, workers=4):
+        self._tasks = queue.Queue()
+        self._timers = []
+        self._keyed = {}
+        self._timer_cond = Condition()
+        self._sequence = itertools.count()
+
+        self._stats_lock = Lock()
+        self._executed = 0
+        self._cancelled = 0
+        self._errors = 0
+        self._wait_total = 0
+        self._wait_max = 0
+        self._lag_total = 0
+        self._lag_max = 0
+        self._lag_count = 0
+
+        for index in range(workers):
+            Thread(target=self._worker, name=f'elrs-osd-worker-{index}', daemon=True).start()
+        Thread(target=self._timer_loop, name='elrs-osd-timers', daemon=True).start()
+        self._workers = workers
+
+    def submit(self, fn, *args):
+        self._tasks.put((time.monotonic(), None, fn, args, None, None))
+
+    def schedule(self, delay, fn, *args, key=None):
+        # A keyed timer supersedes any pending timer with the same key
+        due = time.monotonic() + delay
+        with self._timer_cond:
+            sequence = next(self._sequence)
+            if key is not None:
+                if self._keyed.pop(key, None) is not None:
+                    self._cancelled += 1
+                self._keyed[key] = sequence
+            heapq.heappush(self._timers, (due, sequence, fn, args, key))
+            self._timer_cond.notify()
+
+    def cancel(self, key) -> bool:
+        with self._timer_cond:
+            if self._keyed.pop(key, None) is None:
+                return False
+            self._cancelled += 1
+            return True
+
+    def _timer_loop(self):
+        while True:
+            with self._timer_cond:
+                while not self._timers:
+                    self._timer_cond.wait()
+
+                due = self._timers[0][0]
+                now = time.monotonic()
+                if due > now:
+                    self._timer_cond.wait(due - now)
+                    continue
+
+                due, sequence, fn, args, key = heapq.heappop(self._timers)
+                if key is not None and self._keyed.get(key) != sequence:
+                    continue
+
+            # A keyed task stays cancellable until a worker is about to run it
+            self._tasks.put((due, due, fn, args, key, sequence))
+
+    def _worker(self):
+        while True:
+            queued, due, fn, args, key, sequence = self._tasks.get()
+            if key is not None:
+                with self._timer_cond:
+                    if self._keyed.get(key) != sequence:
+                        continue
+                    del self._keyed[key]
+            started = time.monotonic()
+
+            with self._stats_lock:
+                self._executed += 1
+                wait = started - queued
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                if due is not None:
+                    lag = started - due
+                    self._lag_total += lag
+                    self._lag_max = max(self._lag_max, lag)
+                    self._lag_count += 1
+
+            try:
+                fn(*args)
+            except Exception:
+                with self._stats_lock:
+                    self._errors += 1
+                logger.exception('OSD task failed')
+
+    def stats(self) -> dict:
+        with self._timer_cond:
+            timers = len(self._timers)
+            cancelled = self._cancelled
+        with self._stats_lock:
+            executed = self._executed
+            return {
+                'workers'           : self._workers,
+                'queue_depth'       : self._tasks.qsize(),
+                'timers_pending'    : timers,
+                'executed'          : executed,
+                'cancelled'         : cancelled,
+                'errors'            : self._errors,
+                'wait_avg_ms'       : (self._wait_total / executed * 1e3) if executed else 0,
+                'wait_max_ms'       : self._wait_max * 1e3,
+                'lag_avg_ms'        : (self._lag_total / self._lag_count * 1e3) if self._lag_count else 0,
+                'lag_max_ms'        : self._lag_max * 1e3,
+            }
@@ -0,0 +1,175 @@
+import heapq
+import itertools
+import queue
+
+from enum import IntEnum
+from threading import Condition
+
+#
+# Backpack send queue
+#
+
+class sendPriority(IntEnum):
+    CONTROL = 0
+    STATUS = 1
+    LAP = 2
+    COSMETIC = 3
+
+def item_size(item) -> int:
+    # Bytes of the encoded frames in an item; deferred operations count as nothing
+    return sum(len(frame) for frame in item if not callable(frame))
+
+class priority_send_queue():
+    '''
+    Bounded priority queue of backpack transactions. Items are served by
+    priority class, FIFO within a class. An item put with a supersede key
+    drops any queued item with the same key, and supersede() removes the
+    items a clear makes stale. When the queue is full, the
+    oldest item of the least urgent class is evicted to make room.
+    '''
+
+    def __init__(self, maxsize=200):
+        self._maxsize = maxsize
+        self._heap = []
+        self._keyed = {}
+        self._live = 0
+        self._bytes = 0
+        self._sequence = itertools.count()
+        self._cond = Condition()
+
+        self._depth = {priority: 0 for priority in sendPriority}
+        self._dropped = {priority: 0 for priority in sendPriority}
+        self._superseded = {priority: 0 for priority in sendPriority}
+        self._high_water = {priority: 0 for priority in sendPriority}
+
+    def qsize(self) -> int:
+        with self._cond:
+            return self._live
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+    def queued_bytes(self) -> int:
+        with self._cond:
+            return self._bytes
+
+    def put(self, item, priority=sendPriority.COSMETIC, key=None, block=False):
+        with self._cond:
+            if key is not None:
+                previous = self._keyed.pop(key, None)
+                if previous is not None:
+                    self._discard(previous)
+                    self._superseded[previous[0]] += 1
+
+            if self._live >= self._maxsize and not self._evict(priority):
+                self._dropped[priority] += 1
+                raise queue.Full
+
+            entry = [priority, next(self._sequence), item, key, True, item_size(item)]
+            heapq.heappush(self._heap, entry)
+            if key is not None:
+                self._keyed[key] = entry
+            self._live += 1
+            self._bytes += entry[5]
+            self._depth[priority] += 1
+            self._high_water[priority] = max(self._high_water[priority], self._depth[priority])
+            self._cond.notify()
+
+    def supersede(self, priority, drop, promote):
+        '''
+        Called before queueing an item that makes older, less urgent items
+        stale, such as a screen clear. Items drop(item) selects are removed;
+        items promote(item) selects, which carry other content as well, move
+        up to priority so they are still sent before the new item.
+        '''
+        with self._cond:
+            for entry in list(self._heap):
+                if not entry[4] or entry[0] <= priority:
+                    continue
+                item = entry[2]
+                if drop(item):
+                    if entry[3] is not None:
+                        self._keyed.pop(entry[3], None)
+                    self._discard(entry)
+                    self._superseded[entry[0]] += 1
+                elif promote(item):
+                    # Keeps its sequence number, so it stays ahead of anything queued after it
+                    self._discard(entry)
+                    moved = [priority, entry[1], item, entry[3], True, entry[5]]
+                    heapq.heappush(self._heap, moved)
+                    if entry[3] is not None:
+                        self._keyed[entry[3]] = moved
+                    self._live += 1
+                    self._bytes += moved[5]
+                    self._depth[priority] += 1
+                    self._high_water[priority] = max(self._high_water[priority], self._depth[priority])
+
+    def get(self, block=True, timeout=None):
+        with self._cond:
+            while True:
+                while self._heap and not self._heap[0][4]:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    break
+                if not block:
+                    raise queue.Empty
+                if not self._cond.wait(timeout):
+                    raise queue.Empty
+
+            entry = heapq.heappop(self._heap)
+            priority, _, item, key, _, size = entry
+            if key is not None and self._keyed.get(key) is entry:
+                del self._keyed[key]
+            self._live -= 1
+            self._bytes -= size
+            self._depth[priority] -= 1
+            return item
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def drain(self) -> list:
+        # Removes everything still queued, returned as [(item, priority, key)] in send order
+        with self._cond:
+            entries = sorted(entry for entry in self._heap if entry[4])
+            self._heap = []
+            self._keyed = {}
+            self._live = 0
+            self._bytes = 0
+            self._depth = {priority: 0 for priority in sendPriority}
+            return [(entry[2], entry[0], entry[3]) for entry in entries]
+
+    def _discard(self, entry):
+        entry[4] = False
+        self._live -= 1
+        self._bytes -= entry[5]
+        self._depth[entry[0]] -= 1
+
+    def _evict(self, priority) -> bool:
+        # Drop the oldest queued item of the least urgent class no more urgent than the new item
+        victim = None
+        for entry in self._heap:
+            if not entry[4] or entry[0] < priority:
+                continue
+            if victim is None or entry[0] > victim[0] or (entry[0] == victim[0] and entry[1] < victim[1]):
+                victim = entry
+        if victim is None:
+            return False
+
+        if victim[3] is not None:
+            self._keyed.pop(victim[3], None)
+        self._discard(victim)
+        self._dropped[victim[0]] += 1
+        return True
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                priority.name.lower() : {
+                    'depth'         : self._depth[priority],
+                    'dropped'       : self._dropped[priority],
+                    'superseded'    : self._superseded[priority],
+                    'high_water'    : self._high_water[priority],
+                }
+                for priority in sendPriority
+            }
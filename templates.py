@@ -0,0 +1,78 @@
+import string
+
+from functools import lru_cache
+
+#
+# OSD message text
+#
+
+@lru_cache(maxsize=512)
+def osd_glyphs(text:str) -> bytes:
+    # Characters as written to the OSD, '>>' and '<<' are the font's arrow symbols
+    text = text.replace('>>', 'x')
+    text = text.replace('<<', 'w')
+    return bytes(ord(char) for char in text.strip())
+
+class osd_line(str):
+    '''
+    Message text that carries its OSD glyphs, encoded when the line was
+    built. len() is that of the text, as used for centering.
+    '''
+    glyphs = b''
+
+def compile_line(text:str) -> osd_line:
+    # Plain text such as a configured message, braces are shown as they are
+    line = osd_line(text)
+    line.glyphs = osd_glyphs(text)
+    return line
+
+class osd_template():
+    '''
+    A message with {} slots for its dynamic fields, such as a lap number or
+    a gap time. The fixed text is encoded once; fill() only encodes the
+    slot values and joins the pieces.
+    '''
+
+    def __init__(self, text:str):
+        self.text = text
+        self._literals = []
+        self._specs = []
+        for literal, field, spec, _ in string.Formatter().parse(text):
+            self._literals.append(literal)
+            if field is not None:
+                self._specs.append(spec)
+        if len(self._literals) == len(self._specs):
+            self._literals.append('')
+
+        # The ends of the line are stripped, the arrows are replaced everywhere
+        encoded = [literal.replace('>>', 'x').replace('<<', 'w') for literal in self._literals]
+        encoded[0] = encoded[0].lstrip()
+        encoded[-1] = encoded[-1].rstrip()
+        self._glyphs = [bytes(ord(char) for char in literal) for literal in encoded]
+
+        self._static = None
+        if not self._specs:
+            self._static = osd_line(self._literals[0])
+            self._static.glyphs = self._glyphs[0]
+
+    def fill(self, *values) -> osd_line:
+        if self._static is not None:
+            return self._static
+
+        texts = [format(value, spec) for value, spec in zip(values, self._specs)]
+        pieces = [self._literals[0]]
+        for text, literal in zip(texts, self._literals[1:]):
+            pieces += (text, literal)
+        line = osd_line(''.join(pieces))
+
+        # Values that could form an arrow with the fixed text or reach the
+        # stripped ends of the line are encoded with the line as a whole
+        if any(not text or text != text.strip() or '<' in text or '>' in text for text in texts):
+            line.glyphs = osd_glyphs(line)
+            return line
+
+        glyphs = [self._glyphs[0]]
+        for text, literal in zip(texts, self._glyphs[1:]):
+            glyphs += (text.encode('latin-1'), literal)
+        line.glyphs = b''.join(glyphs)
+        return line
@@ -0,0 +1,84 @@
+from plugins.VRxC_ELRS.sendqueue import sendPriority
+
+#
+# OSD transactions
+#
+
+class osd_transaction():
+    '''
+    Frames addressed to a single pilot, built without holding any lock and
+    handed to the backpack sender as one indivisible unit.
+    '''
+
+    def __init__(self, uid_frame:bytes=None, identifier:str=None, pilot_id=None,
+                 priority:sendPriority=sendPriority.STATUS, key=None):
+        self.uid_frame = uid_frame
+        self.identifier = identifier
+        self.pilot_id = pilot_id
+        self.priority = priority
+        self.key = key
+        self.target = None
+        self.event_time = None
+        self.framebuffer = None
+        # Seconds from the first segment to the last, a clear of the message waits this long too
+        self.held = 0
+        # Rows this transaction clears, or the whole screen
+        self.cleared_rows = set()
+        self.cleared_all = False
+        self._frames = []
+        self._segments = []
+
+    def __len__(self):
+        return len(self._frames)
+
+    def add(self, frame:bytes):
+        self._frames.append(frame)
+
+    def add_op(self, op):
+        # op() is called by the sender and returns the frames to write
+        self._frames.append(op)
+
+    def hold(self, delay):
+        # Frames added after a hold are sent delay seconds after the ones before it
+        if self._frames:
+            self._segments.append((tuple(self._frames), delay))
+            self._frames = []
+        elif self._segments:
+            frames, held = self._segments[-1]
+            self._segments[-1] = (frames, held + delay)
+        else:
+            return
+        self.held += delay
+
+    def take(self) -> list:
+        # Returns [(frames, delay before the next segment)], the last delay is 0
+        segments = self._segments
+        if self._frames or not segments:
+            segments.append((tuple(self._frames), 0))
+        self._frames = []
+        self._segments = []
+        return segments
+
+def render_frames(items:tuple) -> list:
+    # Deferred operations are resolved by the sender, right before writing,
+    # so they see the state that actually reached the backpack
+    frames = []
+    for item in items:
+        if callable(item):
+            frames.extend(item())
+        else:
+            frames.append(item)
+    return frames
+
+def merge_transactions(members:list, clear_uid_frame:bytes) -> tuple:
+    # Several pilots in one queue item: each pilot's frames follow its UID,
+    # and the UID is cleared once at the end instead of after every pilot
+    frames = []
+    for txn, items in members:
+        if not items:
+            continue
+        frames.append(txn.uid_frame)
+        frames.extend(items)
+    if frames:
+        frames.append(clear_uid_frame)
+    return tuple(frames)
@@ -0,0 +1,272 @@
+import logging
+import os
+import queue
+import selectors
+import time
+
+from threading import Lock, Thread
+
+from plugins.VRxC_ELRS.msp import msptypes, msp_parser, encode_msp
+from plugins.VRxC_ELRS.transaction import render_frames
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_REQUEST = encode_msp(msptypes.MSP_ELRS_GET_BACKPACK_VERSION)
+
+#
+# Backpack serial transports
+#
+
+def coalesce_frames(frames:tuple, batch_limit) -> list:
+    # Merge the frames of a transaction into as few writes as the limit allows
+    batches = []
+    batch = bytearray()
+    for frame in frames:
+        if batch and len(batch) + len(frame) > batch_limit:
+            batches.append(bytes(batch))
+            batch = bytearray()
+        batch += frame
+    if batch:
+        batches.append(bytes(batch))
+    return batches
+
+class backpack_transport():
+    '''
+    Moves transactions from the send queue to an open serial port and hands
+    inbound MSP packets to a callback. Packets are read on a thread of their
+    own, so inbound commands never wait behind outbound traffic; on_packet
+    is called on that thread. run() returns when the link fails or the
+    transport is stopped.
+
+    When nothing has been received for heartbeat_interval seconds, a version
+    request is sent; after heartbeat_misses unanswered requests the link is
+    considered dead.
+    '''
+
+    def __init__(self, port, send_queue, on_packet, send_settings, pacer=None, metrics=None,
+                 heartbeat_interval=10.0, heartbeat_misses=3):
+        self._port = port
+        self._queue = send_queue
+        self._on_packet = on_packet
+        self._send_settings = send_settings
+        self._pacer = pacer
+        self._metrics = metrics
+        self._error_count = 0
+        self._running = True
+        self._link_up = True
+        self._parser = msp_parser()
+
+        self._heartbeat_interval = heartbeat_interval
+        self._heartbeat_misses = heartbeat_misses
+        self._last_rx = time.monotonic()
+        self._heartbeats = 0
+
+    def notify(self):
+        pass
+
+    def stop(self):
+        self._running = False
+        self.notify()
+
+    @property
+    def stopped(self) -> bool:
+        # True when run() ended because of stop() rather than a link failure
+        return not self._running
+
+    def run(self):
+        reader = Thread(target=self.receive_loop, daemon=True)
+        reader.start()
+        try:
+            self.send_loop()
+        finally:
+            self._link_up = False
+            reader.join(1.0)
+
+    def send_loop(self):
+        # Drains the queue and sleeps, subclasses may wait for work instead
+        while self._running and self._link_up:
+            if not self.send_pending() or not self.check_heartbeat():
+                return
+            time.sleep(0.01)
+
+    def receive_loop(self):
+        while self._running and self._link_up:
+            if not self.read_packets():
+                self.link_failed()
+                return
+            time.sleep(0.005)
+
+    def link_failed(self):
+        # Called by the reader, ends the send loop as well
+        self._link_up = False
+        self.notify()
+
+    def out_waiting(self) -> int:
+        try:
+            return self._port.out_waiting
+        except Exception:
+            return 0
+
+    def send_pending(self) -> bool:
+        delay, batch_limit = self._send_settings()
+        pacer = self._pacer
+
+        while True:
+            if pacer:
+                pacer.record_backlog(self._queue.qsize())
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return True
+            transaction = render_frames(item)
+
+            if batch_limit:
+                messages = coalesce_frames(transaction, batch_limit)
+            else:
+                messages = transaction
+
+            for message in messages:
+                if pacer:
+                    delay = pacer.delay
+                time.sleep(delay)
+
+                # What the earlier writes left in the output buffer after the gap; read before
+                # writing, as the bytes of this write are always still pending right after it
+                pending = self.out_waiting() if pacer else 0
+
+                started = time.monotonic()
+                try:
+                    self._port.write(message)
+                except Exception:
+                    if self._metrics:
+                        self._metrics.record_write_error()
+                    self._error_count += 1
+                    if self._error_count > 5:
+                        logger.error('Failed to write to backpack. Ending connector thread')
+                        return False
+                else:
+                    self._error_count = 0
+                    if pacer:
+                        pacer.record_write(len(message), time.monotonic() - started, pending)
+
+            if pacer:
+                pacer.record_frames(len(transaction))
+            if self._metrics:
+                self._metrics.record_delivery(item, len(transaction), sum(len(frame) for frame in transaction))
+
+    def read_packets(self) -> bool:
+        try:
+            data = self._port.read(max(1, self._port.in_waiting))
+            if data and self._port.in_waiting:
+                data += self._port.read(self._port.in_waiting)
+        except Exception:
+            logger.error('Failed to read from backpack. Ending connector thread')
+            return False
+
+        if data:
+            frames = self._parser.feed(data)
+            if frames:
+                self._last_rx = time.monotonic()
+                self._heartbeats = 0
+            for mode, payload in frames:
+                if self._metrics:
+                    self._metrics.record_packet(mode)
+                self._on_packet(mode, payload)
+        return True
+
+    def check_heartbeat(self) -> bool:
+        if not self._heartbeat_interval:
+            return True
+
+        idle = time.monotonic() - self._last_rx
+        if idle < self._heartbeat_interval * (self._heartbeats + 1):
+            return True
+
+        if self._heartbeats >= self._heartbeat_misses:
+            logger.error('Backpack stopped responding. Ending connector thread')
+            return False
+
+        self._heartbeats += 1
+        try:
+            self._port.write(HEARTBEAT_REQUEST)
+        except Exception:
+            logger.error('Failed to write to backpack. Ending connector thread')
+            return False
+        return True
+
+class polling_transport(backpack_transport):
+    '''
+    Original connector loop: drain the queue and sleep. The reader polls
+    the port. Both are the base class's loops.
+    '''
+
+class selector_transport(backpack_transport):
+    '''
+    Event-driven transport. The sender waits on a wakeup pipe and the reader
+    on the serial file descriptor, so outbound transactions and inbound
+    packets are handled as soon as they arrive. Under RotorHazard's gevent
+    monkey patching the selectors are gevent's, so waiting yields to the hub
+    instead of blocking it.
+    '''
+
+    def __init__(self, port, send_queue, on_packet, send_settings, pacer=None, metrics=None, **kwargs):
+        super().__init__(port, send_queue, on_packet, send_settings, pacer, metrics, **kwargs)
+        self._wake_lock = Lock()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
+    def notify(self):
+        with self._wake_lock:
+            if self._wake_w is None:
+                return
+            try:
+                os.write(self._wake_w, b'\0')
+            except BlockingIOError:
+                pass
+
+    def run(self):
+        try:
+            super().run()
+        finally:
+            with self._wake_lock:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_w = None
+
+    def send_loop(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._wake_r, selectors.EVENT_READ)
+
+        try:
+            while self._running and self._link_up:
+                if not self.send_pending() or not self.check_heartbeat():
+                    return
+
+                if selector.select(timeout=1.0):
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+        finally:
+            selector.close()
+
+    def receive_loop(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self._port.fileno(), selectors.EVENT_READ)
+
+        try:
+            while self._running and self._link_up:
+                if selector.select(timeout=0.5) and not self.read_packets():
+                    self.link_failed()
+                    return
+        finally:
+            selector.close()
+
+def create_transport(kind:str, port, send_queue, on_packet, send_settings, pacer=None, metrics=None) -> backpack_transport:
+    if kind != 'polling' and os.name == 'posix' and hasattr(port, 'fileno'):
+        try:
+            return selector_transport(port, send_queue, on_packet, send_settings, pacer, metrics)
+        except OSError:
+            logger.warning('Event-driven transport unavailable, falling back to polling')
+    return polling_transport(port, send_queue, on_packet, send_settings, pacer, metrics)